@@ -0,0 +1,167 @@
+import math
+import time
+from typing import Callable
+
+
+class InputFilter():
+    """ Filters the values from an analog control (eg a potentiometer) so that
+    noise doesn't turn into a stream of actions.
+
+    Each value goes through these stages:
+    1. Smoothing, with an exponential moving average whose cutoff frequency
+       rises with the rate of change (a "one euro" filter), so that a resting
+       knob is smoothed heavily while a turning knob isn't delayed much.
+    2. Quantization to num_steps + 1 distinct positions (eg the slider
+       positions 0-100), with hysteresis: the position only changes once the
+       smoothed value is past the edge of the current position by hysteresis
+       steps, so a value sitting on an edge doesn't flip back and forth.
+    3. Deadband: a new position is emitted right away only if it's at least
+       deadband away from the last emitted value.
+    4. Settle timer: positions within the deadband are emitted once the
+       position hasn't changed for settle_time seconds (see poll()), so that
+       small adjustments aren't lost. While values keep arriving, the emitted
+       position is within the hysteresis of the value. Once no values have
+       been received for settle_time seconds, the last value is rounded to
+       the nearest position (without smoothing or hysteresis), so the final
+       position is the one nearest to where the control was left.
+
+    Values that don't result in an emission are counted in num_suppressed. """
+
+    def __init__(self, num_steps: int = 100, deadband: float = 0.03, hysteresis: float = 0.5,
+                 settle_time: float = 0.15, min_cutoff: float = 1.0, beta: float = 0.5,
+                 derivative_cutoff: float = 1.0, clock: Callable[[], float] = time.monotonic):
+        """
+        Parameters
+        ----------
+        num_steps : int
+            The number of steps to quantize [0, 1] to.
+        deadband : float
+            The minimum change in value to emit immediately.
+        hysteresis : float
+            How far past the edge of the current step the value needs to go
+            before changing steps, as a fraction of a step.
+        settle_time : float
+            How long (seconds) the step needs to be unchanged to be emitted
+            when it's within the deadband.
+        min_cutoff : float
+            The smoothing cutoff frequency (Hz) when the value isn't changing.
+            Lower values smooth more.
+        beta : float
+            How much the cutoff frequency increases with the rate of change
+            (Hz per unit/second). Higher values lag less while turning.
+        derivative_cutoff : float
+            The cutoff frequency (Hz) for smoothing the rate of change.
+        """
+        self.num_steps = num_steps
+        self.deadband = deadband
+        self.hysteresis = hysteresis
+        self.settle_time = settle_time
+        self.min_cutoff = min_cutoff
+        self.beta = beta
+        self.derivative_cutoff = derivative_cutoff
+        self.clock = clock
+
+        self.num_received = 0
+        self.num_emitted = 0
+        self.num_suppressed = 0
+
+        self.smoothed: float = None
+        self.last_value: float = None
+        self.step: int = None
+        """ The current quantized position """
+        self.last_emitted_step: int = None
+        self._is_suppressed_pending = False
+        """ True if a value was suppressed since the last emission """
+        self._derivative = 0.0
+        self._last_time: float = None
+        self._step_change_time: float = None
+
+    @property
+    def is_pending(self) -> bool:
+        """ True if the current position hasn't been emitted yet, and will be by poll(). """
+        return self.step is not None and self.step != self.last_emitted_step
+
+    def filter(self, value: float) -> float | None:
+        """ Filters the given raw value.
+
+        Returns
+        -------
+        value: float | None
+            The quantized value to act on, or None if the value was suppressed.
+        """
+        now = self.clock()
+        self.num_received += 1
+        self.last_value = value
+        self._smooth(value, now)
+        self._quantize(now)
+
+        # emit big changes immediately
+        if self.last_emitted_step is None or abs(self.step - self.last_emitted_step) >= self.deadband * self.num_steps:
+            return self._emit()
+
+        self.num_suppressed += 1
+        self._is_suppressed_pending = True
+        return None
+
+    def poll(self) -> float | None:
+        """ Call periodically. Returns the quantized value to act on once the
+        position has settled within the deadband, or None. """
+        now = self.clock()
+
+        # The input has stopped. Don't leave the position lagging behind the last
+        # value, or off by the hysteresis.
+        if self._last_time is not None and now - self._last_time >= self.settle_time and self.smoothed != self.last_value:
+            self.smoothed = self.last_value
+            step = round(min(max(self.smoothed, 0), 1) * self.num_steps)
+            if step != self.step:
+                self.step = step
+                self._step_change_time = self._last_time
+
+        if not self.is_pending:
+            return None
+        if now - self._step_change_time < self.settle_time:
+            return None
+
+        # If this emission replaces a suppressed value, then it isn't an extra action
+        if self._is_suppressed_pending:
+            self.num_suppressed -= 1
+        return self._emit()
+
+    def _quantize(self, now: float):
+        """ Updates the current step from the smoothed value, with hysteresis. """
+        scaled = min(max(self.smoothed, 0), 1) * self.num_steps
+        if self.step is None or abs(scaled - self.step) > 0.5 + self.hysteresis:
+            step = round(scaled)
+            if step != self.step:
+                self.step = step
+                self._step_change_time = now
+
+    def _emit(self) -> float | None:
+        if self.step == self.last_emitted_step:
+            # nothing changed
+            self.num_suppressed += 1
+            self._is_suppressed_pending = True
+            return None
+        self.last_emitted_step = self.step
+        self.num_emitted += 1
+        self._is_suppressed_pending = False
+        return self.step / self.num_steps
+
+    def _smooth(self, value: float, now: float):
+        if self.smoothed is None:
+            self.smoothed, self._last_time = value, now
+            return
+
+        dt = max(now - self._last_time, 1e-3)
+        self._last_time = now
+
+        # smooth the rate of change, and use it to choose how much to smooth the value
+        derivative = (value - self.smoothed) / dt
+        self._derivative += self._alpha(self.derivative_cutoff, dt) * (derivative - self._derivative)
+        cutoff = self.min_cutoff + self.beta * abs(self._derivative)
+        self.smoothed += self._alpha(cutoff, dt) * (value - self.smoothed)
+
+    @staticmethod
+    def _alpha(cutoff: float, dt: float) -> float:
+        tau = 1 / (2 * math.pi * cutoff)
+        return 1 / (1 + tau / dt)
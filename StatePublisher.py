@@ -0,0 +1,94 @@
+import json
+import socket
+import threading
+import time
+from typing import Any, Callable
+
+
+class StatePublisher():
+    """ Pushes state changes (mute state, selected user, volume, etc) to
+    subscribed controllers over UDP.
+
+    Changes are coalesced: every push contains the full current state, and
+    there are at least min_interval seconds between pushes, so a burst of
+    changes results in a single push. Subscriptions expire after
+    subscription_ttl seconds, so controllers should re-subscribe periodically. """
+
+    def __init__(self, sock: socket.socket, min_interval: float = 0.05, subscription_ttl: float = 60,
+                 clock: Callable[[], float] = time.monotonic):
+        self.sock = sock
+        self.min_interval = min_interval
+        self.subscription_ttl = subscription_ttl
+        self.clock = clock
+
+        self.state: dict[str, Any] = {}
+        self.num_pushes = 0
+        self._subscribers: dict[tuple[str, int], float] = {}
+        """ Address to expiration time """
+        self._is_pending = False
+        self._last_push_time = -min_interval
+        self._cond = threading.Condition()
+
+    def subscribe(self, addr: tuple[str, int]):
+        """ Adds (or renews) the subscriber, and sends it the current state. """
+        with self._cond:
+            is_new = addr not in self._subscribers
+            self._subscribers[addr] = self.clock() + self.subscription_ttl
+            message = self._state_message()
+        if is_new:
+            print(f"New subscriber: {addr}")
+        self._send(message, [addr])
+
+    def unsubscribe(self, addr: tuple[str, int]):
+        with self._cond:
+            self._subscribers.pop(addr, None)
+
+    def publish(self, **changes):
+        """ Updates the state with the given values. Subscribers are sent the
+        new state on the next push, if anything actually changed. """
+        with self._cond:
+            is_changed = any(k not in self.state or self.state[k] != v for k, v in changes.items())
+            if not is_changed:
+                return
+            self.state.update(changes)
+            self._is_pending = True
+            self._cond.notify()
+
+    def run(self):
+        """ Sends the pending pushes. Runs forever, call from a dedicated thread. """
+        while True:
+            with self._cond:
+                while not self._is_pending:
+                    self._cond.wait()
+
+                # rate limit
+                wait_time = self._last_push_time + self.min_interval - self.clock()
+                if wait_time > 0:
+                    self._cond.wait(wait_time)
+                    continue
+
+                self._is_pending = False
+                self._last_push_time = self.clock()
+                message = self._state_message()
+                subscribers = self._get_subscribers()
+
+            self._send(message, subscribers)
+
+    def _get_subscribers(self) -> list[tuple[str, int]]:
+        now = self.clock()
+        for addr, expiration in list(self._subscribers.items()):
+            if expiration < now:
+                print(f"Subscription expired: {addr}")
+                del self._subscribers[addr]
+        return list(self._subscribers)
+
+    def _state_message(self) -> bytes:
+        self.num_pushes += 1
+        return json.dumps({"state": self.num_pushes, **self.state}).encode("utf-8")
+
+    def _send(self, message: bytes, addrs: list[tuple[str, int]]):
+        for addr in addrs:
+            try:
+                self.sock.sendto(message, addr)
+            except OSError as ex:
+                print(f"Failed to send state to {addr}: {repr(ex)}")
@@ -0,0 +1,268 @@
+""" Benchmarks for the hot paths, run over synthetic discord screens.
+
+Times the user locator, geometry operations, Fresh.get() overhead, the window
+tracker's cached lookups, and the mic template match. Results are written as
+json, and compared against a stored baseline. Any benchmark whose fastest
+time is slower than its baseline by more than the tolerance (and by more than
+the noise floor) is reported, and the script exits with status 1. Times are
+scaled by the change in a fixed reference workload first, so that a machine
+that's busier (or throttled) than when the baseline was saved doesn't report
+everything as slower. Baselines
+are machine specific, so none is committed: the script also exits with status
+1 if there's no baseline to compare against.
+
+Usage:
+    python benchmarks/bench_hotpaths.py [--monitor-height 1080] [--users 20] [--library 40]
+    python benchmarks/bench_hotpaths.py --save-baseline
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import timeit
+from typing import Callable
+
+import cv2 as cv
+import numpy as np
+from PIL import Image
+
+root = os.path.normpath(os.path.join(__file__, "..", ".."))
+sys.path.append(root)
+sys.path.append(os.path.join(root, "benchmarks"))
+import synthetic_screens
+from discord_interaction.LocatorUserImages import LocatorUserImages
+from discord_interaction.WindowTracker import WindowTracker
+from Fresh import Fresh
+from geometry import Pxy, Rect
+
+default_baseline_path = os.path.join(root, "benchmarks", "baseline.json")
+default_output_path = os.path.join(root, "benchmarks", "results.json")
+
+
+def time_call(func: Callable, repeat: int = 7) -> dict[str, float]:
+    """ Times func, returning the min and median time per call in microseconds. """
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    times_us = [t / number * 1e6 for t in timer.repeat(repeat=repeat, number=number)]
+    return {"min_us": min(times_us), "median_us": statistics.median(times_us), "calls": number}
+
+
+def bench_locator(monitor_height: int, user_count: int, library_size: int, icons_dir: str) -> dict[str, Callable]:
+    icon_paths = synthetic_screens.make_icon_library(library_size, icons_dir)
+    column, regions = synthetic_screens.make_user_column(icon_paths, monitor_height, user_count)
+    frame_grabber = synthetic_screens.FakeFrameGrabber(column)
+    locator = LocatorUserImages(frame_grabber, icons_dir)
+    full_scan_locator = LocatorUserImages(frame_grabber, icons_dir, predict_rows=False)
+
+    # sanity check that the synthetic screen can actually be located
+    for l in [locator, full_scan_locator]:
+        located, _ = l.locate_users_annotations()
+        if len(located) != user_count:
+            raise RuntimeError(f"Expected to locate {user_count} users, but found {len(located)}")
+
+    return {
+        "locator.locate_users_annotations": locator.locate_users_annotations,
+        "locator.locate_users_annotations.no_annotate": lambda: locator.locate_users_annotations(annotate=False),
+        "locator.locate_users_annotations.full_scan": lambda: full_scan_locator.locate_users_annotations(annotate=False),
+    }
+
+
+def bench_geometry() -> dict[str, Callable]:
+    a, b = Pxy(10, 20), Pxy(3, 4)
+    rect = Rect.from_xywh(100, 200, 300, 400)
+
+    return {
+        "geometry.Pxy.add": lambda: a + b,
+        "geometry.Pxy.sub": lambda: a - b,
+        "geometry.Pxy.truediv": lambda: a / 2,
+        "geometry.Rect.from_xywh": lambda: Rect.from_xywh(100, 200, 300, 400),
+        "geometry.Rect.add": lambda: rect + a,
+        "geometry.Rect.clip": lambda: rect.clip(0, 250, 0, 500),
+        "geometry.Rect.contains": lambda: rect.contains(a),
+        "geometry.Rect.get_corners_xy": lambda: rect.get_corners_xy(),
+        "geometry.Rect.eq": lambda: rect == Rect.from_xywh(100, 200, 300, 400),
+    }
+
+
+def bench_fresh() -> dict[str, Callable]:
+    plain = Fresh(lambda: 1)
+    with_ref = Fresh(lambda: 1, expiration_ref_obj=lambda: Rect.from_xywh(0, 0, 10, 10))
+    no_expiration = Fresh(lambda: 1, expiration_time=None)
+    for fresh in [plain, with_ref, no_expiration]:
+        fresh.get()
+
+    return {
+        "Fresh.get": plain.get,
+        "Fresh.get.expiration_ref_obj": with_ref.get,
+        "Fresh.get.no_expiration": no_expiration.get,
+    }
+
+
+def bench_window_tracker() -> dict[str, Callable]:
+    tracker = WindowTracker(lambda: 1, synthetic_screens.FakeWindowLayer(), hooked_poll_interval=3600)
+    tracker.generation
+
+    return {
+        "WindowTracker.generation": lambda: tracker.generation,
+        "WindowTracker.window_region": lambda: tracker.window_region,
+    }
+
+
+def bench_mic_match() -> dict[str, Callable]:
+    mic_image = np.array(Image.open(os.path.join(root, "media", "mic_thresholded.png")))[:, :, 0].squeeze()
+    mic_mask = np.array(Image.open(os.path.join(root, "media", "mic_mask.png")))[:, :, 0].squeeze()
+
+    # a 61x61 grab (as in _get_mic_center_for_grabbing), with the mic slightly off center
+    grabbed = np.full((61, 61, 3), synthetic_screens.background_color, dtype=np.uint8)
+    h, w = mic_image.shape
+    grabbed[27:27+h, 24:24+w, 0] = np.maximum(grabbed[27:27+h, 24:24+w, 0], mic_image)
+
+    # same as DiscordAPI._get_mic_center_for_grabbing
+    thresholded = np.empty(grabbed.shape[:2], dtype=grabbed.dtype)
+    match_matrix = np.empty((grabbed.shape[0] - h + 1, grabbed.shape[1] - w + 1), dtype=np.float32)
+
+    def match():
+        np.greater(grabbed[:, :, 0], 150, out=thresholded)
+        np.multiply(thresholded, 255, out=thresholded)
+        cv.matchTemplate(thresholded, mic_image, cv.TM_SQDIFF, result=match_matrix, mask=mic_mask)
+        return cv.minMaxLoc(match_matrix)
+
+    return {
+        "mic.threshold_and_match": match,
+    }
+
+
+def bench_reference() -> dict[str, Callable]:
+    """ Fixed workloads that don't depend on any of our code, used to measure
+    how fast the machine is running compared to when the baseline was saved. """
+    array = np.arange(100_000, dtype=np.uint8)
+    out = np.empty_like(array)
+
+    return {
+        "reference.python": lambda: sum(i * i for i in range(1000)),
+        "reference.numpy": lambda: np.add(array, 1, out=out),
+    }
+
+
+def run(monitor_height: int, user_count: int, library_size: int, repeat: int) -> dict:
+    with tempfile.TemporaryDirectory() as icons_dir:
+        benchmarks: dict[str, Callable] = {}
+        benchmarks.update(bench_reference())
+        benchmarks.update(bench_locator(monitor_height, user_count, library_size, icons_dir))
+        benchmarks.update(bench_geometry())
+        benchmarks.update(bench_fresh())
+        benchmarks.update(bench_window_tracker())
+        benchmarks.update(bench_mic_match())
+
+        results: dict[str, dict[str, float]] = {}
+        for name, func in benchmarks.items():
+            results[name] = time_call(func, repeat)
+            print(f"{name:<40} {results[name]['median_us']:>12.2f} us")
+
+    return {
+        "meta": {
+            "monitor_height": monitor_height,
+            "users": user_count,
+            "library": library_size,
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "cv2": cv.__version__,
+            "machine": platform.platform(),
+        },
+        "results": results,
+    }
+
+
+def compare(results: dict, baseline: dict, tolerance: float, noise_floor_us: float) -> list[str]:
+    """ Compares the min times in results against the baseline. The min is
+    used because it's the least affected by other activity on the machine.
+
+    Parameters
+    ----------
+    tolerance : float
+        The allowed slowdown, relative to the baseline (0.25 = 25%).
+    noise_floor_us : float
+        Slowdowns smaller than this (in microseconds) are ignored, so that
+        sub-microsecond benchmarks don't fail on timing noise.
+
+    Returns
+    -------
+    regressions: list[str]
+        A description of each benchmark that was slower than its baseline by more than the tolerance.
+    """
+    if results["meta"] != baseline["meta"]:
+        print("Warning: benchmark parameters or environment differ from the baseline's")
+        for key in results["meta"]:
+            if results["meta"][key] != baseline["meta"].get(key):
+                print(f"    {key}: {baseline['meta'].get(key)} -> {results['meta'][key]}")
+
+    # benchmarks that can't be compared, eg after they were renamed
+    not_in_baseline = [name for name in results["results"] if name not in baseline["results"]]
+    not_in_results = [name for name in baseline["results"] if name not in results["results"]]
+    if len(not_in_baseline) > 0:
+        print(f"Warning: {len(not_in_baseline)} benchmark(s) aren't in the baseline, run with --save-baseline to add them:")
+        for name in not_in_baseline:
+            print("    " + name)
+    if len(not_in_results) > 0:
+        print(f"Warning: {len(not_in_results)} benchmark(s) in the baseline no longer exist:")
+        for name in not_in_results:
+            print("    " + name)
+
+    # how much slower the machine is running than when the baseline was saved
+    reference_ratios = [results["results"][name]["min_us"] / baseline["results"][name]["min_us"]
+                        for name in results["results"] if name.startswith("reference.") and name in baseline["results"]]
+    machine_factor = statistics.geometric_mean(reference_ratios) if len(reference_ratios) > 0 else 1.0
+    if abs(machine_factor - 1) > 0.05:
+        print(f"Machine is running {machine_factor:.2f}x as slow as for the baseline, scaling the baseline to match")
+
+    regressions: list[str] = []
+    for name, result in results["results"].items():
+        if name not in baseline["results"] or name.startswith("reference."):
+            continue
+        baseline_us = baseline["results"][name]["min_us"] * machine_factor
+        ratio = result["min_us"] / baseline_us
+        if ratio > 1 + tolerance and result["min_us"] - baseline_us > noise_floor_us:
+            regressions.append(f"{name}: {baseline_us:.2f} us -> {result['min_us']:.2f} us ({ratio:.2f}x)")
+
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the locator, geometry, Fresh and mic matching hot paths")
+    parser.add_argument("--monitor-height", type=int, default=1080, help="height of the synthetic user column")
+    parser.add_argument("--users", type=int, default=20, help="number of users visible in the column")
+    parser.add_argument("--library", type=int, default=40, help="number of user images to load")
+    parser.add_argument("--repeat", type=int, default=7, help="number of timing repetitions per benchmark")
+    parser.add_argument("--output", default=default_output_path, help="where to write the results json")
+    parser.add_argument("--baseline", default=default_baseline_path, help="the baseline json to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown relative to the baseline (0.25 = 25%%)")
+    parser.add_argument("--noise-floor", type=float, default=2.0, help="slowdowns smaller than this many microseconds are ignored")
+    parser.add_argument("--save-baseline", action="store_true", help="store these results as the new baseline")
+    args = parser.parse_args()
+
+    results = run(args.monitor_height, args.users, args.library, args.repeat)
+    with open(args.output, "w") as fout:
+        json.dump(results, fout, indent=4)
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as fout:
+            json.dump(results, fout, indent=4)
+        print(f"Saved baseline to {args.baseline}")
+        sys.exit(0)
+
+    if not os.path.isfile(args.baseline):
+        print(f"ERROR: no baseline at {args.baseline}, run with --save-baseline to create one")
+        sys.exit(1)
+
+    with open(args.baseline, "r") as fin:
+        baseline = json.load(fin)
+    regressions = compare(results, baseline, args.tolerance, args.noise_floor)
+    if len(regressions) > 0:
+        print(f"\nPERFORMANCE REGRESSION: {len(regressions)} benchmark(s) slower than baseline by more than {args.tolerance:.0%} (and {args.noise_floor} us)")
+        for regression in regressions:
+            print("    " + regression)
+        sys.exit(1)
+    print("\nNo regressions against baseline")
@@ -0,0 +1,130 @@
+""" Startup benchmark for the server.
+
+Measures two things:
+ - the import time of the server module, as reported by `python -X importtime`
+ - the time from launching server.py until it handles its first control packet
+
+Usage:
+    python benchmarks/bench_startup.py [--port 6332] [--output startup.json]
+"""
+import argparse
+import json
+import os
+import re
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+root = os.path.normpath(os.path.join(__file__, "..", ".."))
+
+heavy_modules = ["cv2", "numpy", "PIL", "pywinauto", "screeninfo"]
+""" Modules that should not be imported before the server starts listening """
+
+_importtime_re = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def measure_import_time(module: str = "server") -> dict:
+    """ Imports the given module in a fresh interpreter with -X importtime.
+
+    Returns
+    -------
+    results: dict
+        total_us: the cumulative import time of the module, in microseconds
+        slowest: the ten slowest top-level imports, as [name, cumulative_us]
+        heavy_imports: which of heavy_modules were imported
+    """
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                          cwd=root, capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise RuntimeError(f"Failed to import {module}:\n{proc.stderr}")
+
+    total_us = 0
+    top_level: list[tuple[str, int]] = []
+    imported: set[str] = set()
+    for line in proc.stderr.splitlines():
+        match = _importtime_re.match(line)
+        if match is None:
+            continue
+        cumulative_us, indent, name = int(match.group(2)), match.group(3), match.group(4)
+        imported.add(name.split(".")[0])
+        if len(indent) == 1:
+            top_level.append((name, cumulative_us))
+        if name == module:
+            total_us = cumulative_us
+
+    slowest = sorted(top_level, key=lambda nc: nc[1], reverse=True)[:10]
+    return {
+        "total_us": total_us,
+        "slowest": [list(nc) for nc in slowest],
+        "heavy_imports": [m for m in heavy_modules if m in imported],
+    }
+
+
+def measure_first_packet(port: int = 6332, timeout: float = 10) -> float:
+    """ Launches server.py and sends it packets until it reports having handled one.
+
+    Returns
+    -------
+    seconds: float
+        The time from launching the server until the first packet was handled.
+    """
+    handled = threading.Event()
+    handled_time: list[float] = []
+
+    start_time = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, "-u", "server.py"], cwd=root,
+                            stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+
+    def watch_output():
+        for line in proc.stdout:
+            if line.startswith("received message on port"):
+                handled_time.append(time.perf_counter())
+                handled.set()
+                return
+
+    threading.Thread(target=watch_output, daemon=True).start()
+
+    sock = socket.socket(socket.AF_INET, # Internet
+                         socket.SOCK_DGRAM) # UDP
+    try:
+        stop_time = start_time + timeout
+        while not handled.is_set():
+            if time.perf_counter() > stop_time:
+                raise TimeoutError(f"Server didn't handle a packet within {timeout} seconds")
+            try:
+                sock.sendto(b"1", ("127.0.0.1", port))
+            except OSError:
+                pass # nothing is listening yet
+            handled.wait(0.002)
+    finally:
+        sock.close()
+        proc.kill()
+        proc.wait()
+
+    return handled_time[0] - start_time
+
+
+def run(port: int = 6332) -> dict:
+    results = measure_import_time("server")
+    results["first_packet_s"] = measure_first_packet(port)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark server startup")
+    parser.add_argument("--port", type=int, default=6332, help="port to send the first packet to (default 6332, next user)")
+    parser.add_argument("--output", help="write the results as json to this file")
+    args = parser.parse_args()
+
+    results = run(args.port)
+    print(f"import server:     {results['total_us'] / 1000:.1f} ms")
+    for name, cumulative_us in results["slowest"]:
+        print(f"    {name:<30} {cumulative_us / 1000:.1f} ms")
+    print(f"heavy imports:     {', '.join(results['heavy_imports']) or 'none'}")
+    print(f"first packet:      {results['first_packet_s'] * 1000:.1f} ms")
+
+    if args.output is not None:
+        with open(args.output, "w") as fout:
+            json.dump(results, fout, indent=4)
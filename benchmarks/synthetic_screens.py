@@ -0,0 +1,141 @@
+""" Generates synthetic discord screens for benchmarking.
+
+The user icons are derived from the real example icon in
+media/user_pics_example, with the part of the icon that the locator matches
+against (see User.cropped_voice_icon) recolored per user so that every icon in
+the library is distinct.
+"""
+import os
+import sys
+
+import numpy as np
+from PIL import Image
+
+root = os.path.normpath(os.path.join(__file__, "..", ".."))
+sys.path.append(root)
+from geometry import Pxy, Rect
+
+example_icon_path = os.path.join(root, "media", "user_pics_example", "example.png")
+
+background_color = (43, 45, 49)
+""" The color of discord's channel sidebar """
+column_width = 50
+""" The width of the user images column, as grabbed by LocatorUserImages """
+icon_x = 4
+""" The x position of the user icons within the column """
+row_pitch = 32
+""" The vertical distance between users in the voice channel list """
+list_top = 180
+""" The y position of the first user in the voice channel list """
+
+
+def make_icon_library(library_size: int, out_dir: str, seed: int = 0) -> list[str]:
+    """ Writes library_size distinct user icons to out_dir.
+
+    Returns
+    -------
+    paths: list[str]
+        The path/name.ext of each icon, in generation order.
+    """
+    base_icon = np.array(Image.open(example_icon_path))[:, :, :3]
+    rng = np.random.default_rng(seed)
+
+    os.makedirs(out_dir, exist_ok=True)
+    paths: list[str] = []
+    for i in range(library_size):
+        icon = base_icon.copy()
+        shift = rng.integers(1, 256, size=3)
+        icon[6:18, 6:18] = ((icon[6:18, 6:18].astype(np.int32) + shift) % 256).astype(np.uint8)
+
+        path = os.path.join(out_dir, "user_%03d.png" % i)
+        Image.fromarray(icon).save(path)
+        paths.append(path)
+
+    return paths
+
+
+def make_user_column(icon_paths: list[str], monitor_height: int, user_count: int) -> tuple[np.ndarray, list[Rect]]:
+    """ Draws the first user_count icons into a user images column
+    (as would be grabbed by LocatorUserImages.grab_user_images_slice).
+
+    Returns
+    -------
+    column: np.ndarray
+        The monitor_height x column_width RGB image.
+    regions: list[Rect]
+        Where each icon was drawn, in column coordinates.
+    """
+    column = np.empty((monitor_height, column_width, 3), dtype=np.uint8)
+    column[:, :] = background_color
+
+    regions: list[Rect] = []
+    for i, path in enumerate(icon_paths[:user_count]):
+        icon = np.array(Image.open(path))[:, :, :3]
+        h, w = icon.shape[:2]
+        top_left = Pxy(icon_x, list_top + i * row_pitch)
+        if top_left.y + h > monitor_height:
+            raise ValueError(f"Can't fit {user_count} users into a column of height {monitor_height}")
+        column[top_left.y:top_left.y+h, top_left.x:top_left.x+w] = icon
+        regions.append(Rect.from_xywh(top_left.x, top_left.y, w, h))
+
+    return column, regions
+
+
+class FakeFrameGrabber():
+    """ Stands in for DiscordWindowFinder, with a window that's empty except
+    for the given user images column at column_x. """
+
+    def __init__(self, column: np.ndarray, column_x: int = 116, window_width: int = 1280):
+        self.window = np.empty((column.shape[0], window_width, 3), dtype=np.uint8)
+        self.window[:, :] = background_color
+        self.window[:, column_x:column_x+column.shape[1]] = column
+        self.monitor_area = Rect.from_xywh(0, 0, 1920, column.shape[0])
+        self.generation = 0
+
+    @property
+    def width(self) -> int:
+        return self.window.shape[1]
+
+    @property
+    def height(self) -> int:
+        return self.window.shape[0]
+
+    def grab(self, reg: Rect = None, pooled: bool = False) -> np.ndarray:
+        if reg is None:
+            return self.window
+        reg = reg.clip(0, self.width, 0, self.height)
+        return self.window[reg.y:reg.bottom_right.y, reg.x:reg.bottom_right.x]
+
+
+class FakeWindowLayer():
+    """ Stands in for WindowTracker's Win32WindowLayer, with a window and monitors
+    that can be changed by assigning to window_region and monitors. Counts the
+    calls made to it, and keeps the change notification callback so that a
+    notification can be sent with notify(). """
+
+    def __init__(self, window_region: Rect = None, monitors: list[Rect] = None, is_hookable: bool = True):
+        self.window_region = window_region if window_region is not None else Rect.from_xywh(100, 50, 1280, 1000)
+        self.monitors = monitors if monitors is not None else [Rect.from_xywh(0, 0, 1920, 1080)]
+        self.is_hookable = is_hookable
+        self.callback = None
+        self.num_window_reads = 0
+        self.num_monitor_reads = 0
+        self.num_hooks = 0
+
+    def get_window_rect(self, hwnd: int) -> Rect | None:
+        self.num_window_reads += 1
+        return self.window_region
+
+    def get_monitors(self) -> list[Rect]:
+        self.num_monitor_reads += 1
+        return list(self.monitors)
+
+    def start_change_notifications(self, hwnd: int, callback) -> bool:
+        self.num_hooks += 1
+        self.callback = callback
+        return self.is_hookable
+
+    def notify(self):
+        """ Sends a change notification, as the OS would when the window moves. """
+        if self.callback is not None:
+            self.callback()
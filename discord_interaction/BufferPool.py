@@ -0,0 +1,34 @@
+import threading
+
+import numpy as np
+
+
+class BufferPool():
+    """ Hands out reusable numpy arrays, so that code that runs every frame
+    doesn't need to allocate new ones.
+
+    Buffers are keyed by name, shape and dtype, and are kept per thread, so a
+    buffer returned by get() is only ever reused by the same thread. A buffer
+    is valid until the next call to get() with the same name, shape and dtype;
+    callers that need to keep the contents longer should copy them. """
+
+    def __init__(self, max_buffers_per_thread: int = 32):
+        self.max_buffers_per_thread = max_buffers_per_thread
+        self._local = threading.local()
+
+    def get(self, name: str, shape: tuple[int, ...], dtype: type = np.uint8) -> np.ndarray:
+        """ Get an uninitialized buffer with the given name, shape and dtype. """
+        buffers: dict[tuple, np.ndarray] = getattr(self._local, "buffers", None)
+        if buffers is None:
+            buffers = self._local.buffers = {}
+
+        key = (name, shape, dtype)
+        buf = buffers.pop(key, None)
+        if buf is None:
+            # drop the least recently used buffer, eg for a window size we're no longer using
+            if len(buffers) >= self.max_buffers_per_thread:
+                buffers.pop(next(iter(buffers)))
+            buf = np.empty(shape, dtype=dtype)
+        buffers[key] = buf
+
+        return buf
@@ -0,0 +1,125 @@
+import os
+import sys
+
+import cv2 as cv
+import numpy as np
+from PIL import Image
+
+root = os.path.normpath(os.path.join(__file__, "..", ".."))
+sys.path.append(root)
+import tracing
+from discord_interaction.DiscordWindowFinder import DiscordWindowFinder
+from discord_interaction.LocatorUserImages import LocatorUserImages
+from discord_interaction.MuteState import MuteState
+from discord_interaction.User import User
+from Fresh import Fresh
+from geometry import Pxy, Rect
+
+
+class DiscordAPI():
+    def __init__(self, app_images_dir: str, user_images_dir: str):
+        self.app_images_dir = app_images_dir
+        self.user_images_dir = user_images_dir
+        self.discord_window = DiscordWindowFinder()
+        self.user_locator = LocatorUserImages(self.discord_window, user_images_dir)
+
+        self.users: Fresh[tuple[User, ...]] = Fresh(lambda: self.user_locator.locate_users_annotations(annotate=False)[0])
+        self.mic_center_for_grabbing: Fresh[Pxy] = Fresh(self._get_mic_center_for_grabbing, expiration_ref_obj=lambda: self.discord_window.generation)
+        self.mute_state = MuteState(self._observe_muted, lambda: self.discord_window.generation)
+        self.mic_image: np.ndarray = None
+        self.mic_mask: np.ndarray = None
+
+    def update(self):
+        """ Allows all Fresh values to update, as necesssary.
+        Useful for maintaining a consistent state during evaluation.
+        Should be called at the start of an evaluation. """
+        # unlock all Fresh values
+        self.users.unlock()
+
+        # if the window isn't visible, then we activate it to bring it to the foreground
+        if self.num_users == 0:
+            self.discord_window.activate_window()
+
+        # mark all Fresh values as needing to update
+        self.users.needs_refresh = True
+
+        # lock all Fresh values
+        self.users.lock()
+
+    @property
+    def num_users(self):
+        return len(self.users.get())
+
+    def get_user_by_index(self, idx: int) -> User:
+        if self.num_users == 0:
+            return None
+        idx %= self.num_users
+        return self.users.get()[idx]
+
+    def get_user_by_name(self, partial_name: str) -> User:
+        for user in self.users.get():
+            print(user.voice_icon_path_name_ext)
+            print(user.voice_icon_name_ext)
+            if partial_name in user.voice_icon_name_ext:
+                return user
+        return None
+
+    @tracing.traced()
+    def _get_mic_center_for_grabbing(self):
+        radius = Pxy(30, 30)
+
+        # grab a portion of the screen roughly corresponding to where the mic is
+        voice_status_corner_approx = self.discord_window.virtual_coord(Pxy(80, -152), 'bl')
+        mic_center_approx = voice_status_corner_approx + Pxy(152, 116)
+        mic_region_approx = Rect(mic_center_approx - radius, mic_center_approx + radius)
+        mic_image = self.discord_window.grab(mic_region_approx - self.discord_window.window_corner(), pooled=True)
+
+        # convert to black and white
+        buffer_pool = self.discord_window.buffer_pool
+        thresholded = buffer_pool.get("mic_thresholded", mic_image.shape[:2], mic_image.dtype)
+        np.greater(mic_image[:, :, 0], 150, out=thresholded)
+        np.multiply(thresholded, 255, out=thresholded)
+
+        # find the best matching location
+        if self.mic_image is None:
+            mic_path = os.path.normpath(os.path.join(self.app_images_dir, "mic_thresholded.png"))
+            mic_mask_path = os.path.normpath(os.path.join(self.app_images_dir, "mic_mask.png"))
+            self.mic_image = np.array(Image.open(mic_path))[:, :, 0].squeeze()
+            self.mic_mask = np.array(Image.open(mic_mask_path))[:, :, 0].squeeze()
+        with tracing.span("matchTemplate"):
+            match_shape = (thresholded.shape[0] - self.mic_image.shape[0] + 1, thresholded.shape[1] - self.mic_image.shape[1] + 1)
+            match_matrix = buffer_pool.get("mic_match", match_shape, np.float32)
+            cv.matchTemplate(thresholded, self.mic_image, cv.TM_SQDIFF, result=match_matrix, mask=self.mic_mask)
+            _, _, match_loc_xy, _ = cv.minMaxLoc(match_matrix)
+        match_loc = Pxy(match_loc_xy[0], match_loc_xy[1])
+
+        # use this value as an offset from the expected center
+        match_ul = mic_center_approx - radius + match_loc
+        return match_ul + (Pxy(self.mic_image.shape[1], self.mic_image.shape[0]) / 2)
+
+    @tracing.traced()
+    def is_muted(self) -> bool:
+        """ Looks at the mic to determine if we're muted, activating discord to see it.
+        Prefer self.mute_state.get(), which avoids looking when the state is already known. """
+        return self.mute_state.refresh(may_activate=True)
+
+    def _observe_muted(self, may_activate: bool) -> bool | None:
+        """ Looks at the mic. Returns None if discord isn't in the foreground and may_activate is False. """
+        if may_activate:
+            # activate the discord window
+            self.discord_window.activate_window()
+        elif not self.discord_window.is_foreground():
+            return None
+
+        # grab the mic image
+        mic_center = self.mic_center_for_grabbing.get()
+        mic_region = Rect(mic_center - Pxy(13, 13), mic_center + Pxy(13, 13))
+        mic_image = self.discord_window.grab(mic_region - self.discord_window.window_corner(), pooled=True)
+
+        # return true if red
+        thresholded = self.discord_window.buffer_pool.get("is_muted_thresholded", mic_image.shape, bool)
+        np.greater(mic_image, 150, out=thresholded)
+        r, g, b = np.count_nonzero(thresholded[:,:,0]), np.count_nonzero(thresholded[:,:,1]), np.count_nonzero(thresholded[:,:,2])
+        if r > (g + b):
+            return True
+        return False
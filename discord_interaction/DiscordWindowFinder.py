@@ -4,11 +4,13 @@ import sys
 
 import numpy as np
 import pywinauto
-import screeninfo
+import tracing
 from geometry import Pxy, Rect
-from PIL import ImageGrab
 
 sys.path.append(os.path.normpath(os.path.join(__file__, "..", "..")))
+from discord_interaction.BufferPool import BufferPool
+from discord_interaction.ScreenCapture import ScreenCapture
+from discord_interaction.WindowTracker import WindowTracker
 
 
 class DiscordWindowFinder():
@@ -18,7 +20,10 @@ class DiscordWindowFinder():
         self.monitor_idx: int = 0
         self.monitor_area: Rect = None
         self.discord_handle: int = None
-        self.last_discord_reg: Rect = None
+        self.window_tracker = WindowTracker(self.get_discord_window_handle)
+        self.last_generation: int = None
+        self.buffer_pool = BufferPool()
+        self.screen_capture = ScreenCapture(self.buffer_pool)
 
         self._update_window_for_discord()
 
@@ -29,18 +34,23 @@ class DiscordWindowFinder():
     @property
     def height(self):
         return self._get_window_region().height
+
+    @property
+    def generation(self) -> int:
+        """ Changes whenever the discord window region or the monitor layout changes. """
+        return self.window_tracker.generation
     
-    def _update_window_for_discord(self, discord_reg: Rect = None):
+    def _update_window_for_discord(self):
         """ Chooses the window in which discord is currently visible. """
-        # get the region of the continuous screen in which to find discord.
-        if discord_reg is None:
-            discord_reg = self._get_discord_region()
-
         # Assume that if the discord location hasn't changed,
         # then the window hasn't changed.
-        if discord_reg == self.last_discord_reg:
+        generation = self.generation
+        if generation == self.last_generation:
             return
-        self.last_discord_reg = discord_reg
+
+        # get the region of the continuous screen in which to find discord.
+        discord_reg = self._get_discord_region()
+        self.last_generation = generation
 
         # choose the monitor that contains the center pixel for discord
         middle_pixel = Pxy(int(discord_reg.width / 2), int(discord_reg.height / 2))
@@ -50,13 +60,19 @@ class DiscordWindowFinder():
         # set internal values
         if monitor_idx != self.monitor_idx:
             print(f"New monitor: {monitor_idx}")
-            self.monitor_idx, self.monitor_area = monitor_idx, monitor_area
+        self.monitor_idx, self.monitor_area = monitor_idx, monitor_area
     
     def does_window_exist(self):
         hwnd = self.discord_handle
         user32 = ctypes.windll.user32
         return user32.IsWindow(hwnd)
 
+    def is_foreground(self) -> bool:
+        """ True if discord is the foreground window (and so isn't covered by other windows). """
+        hwnd = self.get_discord_window_handle()
+        user32 = ctypes.windll.user32
+        return hwnd is not None and user32.GetForegroundWindow() == hwnd and not user32.IsIconic(hwnd)
+
     def activate_window(self):
         hwnd = self.get_discord_window_handle()
         user32 = ctypes.windll.user32
@@ -64,12 +80,13 @@ class DiscordWindowFinder():
         if user32.IsIconic(hwnd):
             user32.ShowWindow(hwnd, 9)
     
-    def _grab(self, reg: Rect = None) -> np.ndarray:
+    @tracing.traced()
+    def _grab(self, reg: Rect = None, pooled: bool = False) -> np.ndarray:
         # get the discord location
         discord_reg = self._get_discord_region()
 
         # get the latest monitor index and region
-        self._update_window_for_discord(discord_reg)
+        self._update_window_for_discord()
 
         # normalize the discord region to the discord monitor's location
         discord_reg -= self.monitor_area.top_left
@@ -87,14 +104,22 @@ class DiscordWindowFinder():
         reg = reg.clip(0, self.monitor_area.width, 0, self.monitor_area.height)
 
         # grab the region
-        ret_img = ImageGrab.grab((reg + self.monitor_area.top_left).to_ltrb(), all_screens=True)
-        ret = np.array(ret_img)
+        shape = (reg.height, reg.width, 3)
+        if pooled:
+            ret = self.buffer_pool.get("grab", shape)
+        else:
+            ret = np.empty(shape, dtype=np.uint8)
+        self.screen_capture.grab_into((reg + self.monitor_area.top_left).to_ltrb(), ret)
         
         return ret
     
-    def grab(self, reg: Rect = None) -> np.ndarray:
-        """ Grabs an image from the screen, relative to Discord's window """
-        return self._grab(reg)
+    def grab(self, reg: Rect = None, pooled: bool = False) -> np.ndarray:
+        """ Grabs an image from the screen, relative to Discord's window.
+
+        If pooled is True, then the returned image is a reused buffer from
+        self.buffer_pool, which is only valid until the next pooled grab of
+        the same size on the same thread. """
+        return self._grab(reg, pooled)
     
     def window_corner(self, corner='tl') -> Pxy:
         """ Get the corner of the discord window, in virtual screen coordinates """
@@ -114,6 +139,7 @@ class DiscordWindowFinder():
         the given discord window coordinate. """
         return self.window_corner(rel) + coord
 
+    @tracing.traced()
     def get_discord_window_handle(self):
         if self.discord_handle is not None:
             if self.does_window_exist():
@@ -133,10 +159,7 @@ class DiscordWindowFinder():
         return self.discord_handle
 
     def _get_window_region(self) -> Rect | None:
-        hwnd = self.get_discord_window_handle()
-        rect = ctypes.wintypes.RECT()
-        ctypes.windll.user32.GetWindowRect(hwnd, ctypes.pointer(rect))
-        return Rect.from_ltrb(rect.left, rect.top, rect.right, rect.bottom)
+        return self.window_tracker.window_region
 
     def _get_discord_region(self) -> Rect:
         reg = self._get_window_region()
@@ -144,35 +167,7 @@ class DiscordWindowFinder():
             raise RuntimeError("Failed to find window matching 'Discord'")
         return reg
 
-    @staticmethod
-    def _get_matching_monitor_idx_area(screen_location: Pxy) -> tuple[int, Pxy]:
+    def _get_matching_monitor_idx_area(self, screen_location: Pxy) -> tuple[int, Rect]:
         """ Finds the monitor that contains the given virtual screen pixel.
-
-        Parameters
-        ----------
-        screen_location : Pxy
-            The virtual screen pixel to find a matching monitor for.
-
-        Returns
-        -------
-        monitor_idx: int
-            The index of the monitor that contains the screen location.
-        monitor_area: Rect
-            The monitor's area on the virtual screen.
-
-        Raises
-        ------
-        RuntimeError
-            IF the given screen_location isn't located within any of the found monitors
-        """        
-        # get monitor working areas
-        output_working_areas: list[Rect] = []
-        for i, monitor in enumerate(screeninfo.get_monitors()):
-            output_working_areas.append(Rect.from_xywh(monitor.x, monitor.y, monitor.width, monitor.height))
-
-        # choose the monitor that contains the center pixel for discord
-        for i, area in enumerate(output_working_areas):
-            if area.contains(screen_location):
-                return i, area
-        
-        raise RuntimeError(f"Could not find a monitor containing virtual screen location {screen_location}")
\ No newline at end of file
+        See WindowTracker.get_matching_monitor_idx_area(). """
+        return self.window_tracker.get_matching_monitor_idx_area(screen_location)
@@ -0,0 +1,52 @@
+from pynput.keyboard import Controller as Keyboard
+from pynput.keyboard import Key, KeyCode
+
+
+class Keybind():
+    """ A key combination, such as one of discord's global keybinds. """
+
+    aliases = {
+        "control": "ctrl",
+        "win": "cmd",
+        "windows": "cmd",
+        "super": "cmd",
+        "escape": "esc",
+        "return": "enter",
+        "del": "delete",
+    }
+
+    def __init__(self, modifiers: list[Key | KeyCode], key: Key | KeyCode):
+        self.modifiers = modifiers
+        self.key = key
+
+    @classmethod
+    def parse(cls, text: str) -> "Keybind":
+        """ Parses a keybind such as "ctrl+shift+m" or "ctrl+alt+f13".
+
+        Each "+" separated part is either the name of a pynput Key (eg ctrl,
+        shift, alt, cmd, f13, home) or a single character. The last part is the
+        key to tap, and the others are held while tapping it.
+        """
+        parts = [part.strip().lower() for part in text.split("+")]
+        if len(parts) == 0 or "" in parts:
+            raise ValueError(f"Invalid keybind \"{text}\"")
+
+        keys: list[Key | KeyCode] = []
+        for part in parts:
+            part = cls.aliases.get(part, part)
+            if len(part) == 1:
+                keys.append(KeyCode.from_char(part))
+            elif part in Key.__members__:
+                keys.append(Key[part])
+            else:
+                raise ValueError(f"Unknown key \"{part}\" in keybind \"{text}\"")
+
+        return cls(keys[:-1], keys[-1])
+
+    def press(self, keyboard: Keyboard):
+        """ Taps the key while holding the modifiers. """
+        with keyboard.pressed(*self.modifiers):
+            keyboard.tap(self.key)
+
+    def __repr__(self):
+        return "+".join(str(key) for key in self.modifiers + [self.key])
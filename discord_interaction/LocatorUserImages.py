@@ -1,26 +1,68 @@
-import copy
+import math
 import os
 import sys
+import time
+from typing import TYPE_CHECKING
 
 import cv2
 import numpy as np
 from PIL import Image
 
 sys.path.append(os.path.normpath(os.path.join(__file__, "..", "..")))
-from discord_interaction.DiscordWindowFinder import DiscordWindowFinder
+import tracing
+from discord_interaction.BufferPool import BufferPool
 from discord_interaction.User import UpdateStatus as UserUpdateStatus
 from discord_interaction.User import User
+from discord_interaction.UserRegistry import UserRegistry
 from geometry import Pxy, Rect
 
+if TYPE_CHECKING:
+    # only needed for type hints, and pulls in the window apis (pywinauto etc)
+    from discord_interaction.DiscordWindowFinder import DiscordWindowFinder
+
+
+_never_searched = object()
+""" Stands in for the last region of users that haven't been searched for yet """
+
 
 class LocatorUserImages():
-    """ Locates user images within the discord window. """
+    """ Locates user images within the discord window.
 
-    def __init__(self, discord_frame_grabber: DiscordWindowFinder, user_images_dir: str):
+    Discord lists the users in a voice channel at a fixed row pitch. Once
+    the pitch and the position of one row have been learned from confirmed
+    matches, users are located by comparing their image against each
+    predicted row instead of scanning the whole column. A user that was
+    visible but isn't found on any predicted row falls back to a full scan
+    of the column, as do users that have never been searched for. Users
+    that weren't visible last time and aren't on any predicted row are
+    assumed to still be absent, although every full_scan_interval'th call
+    fully scans for them anyway (eg in case they joined a different channel). """
+
+    def __init__(self, discord_frame_grabber: "DiscordWindowFinder", user_images_dir: str, predict_rows: bool = True,
+                 full_scan_interval: int = 20):
         self.discord_frame_grabber = discord_frame_grabber
         self.user_images_dir = user_images_dir
-        self.users: list[User] = []
-        """ Dict of file names+ext (no path) to the loaded and pre-processed image """
+        self.registry = UserRegistry()
+        """ The users loaded from user_images_dir """
+        self.buffer_pool = BufferPool()
+
+        self.predict_rows = predict_rows
+        self.full_scan_interval = full_scan_interval
+        self.row_pitch: int = None
+        """ The vertical distance between users in the voice channel list, once learned """
+        self.row_anchor: Pxy = None
+        """ The window relative top-left of one confirmed user row """
+        self._last_regions: dict[tuple[str, float], Rect | None] = {}
+        """ Where each user (by User.key) was found on the last call, or None if it wasn't found.
+        Only used from the locating thread. """
+        self._num_locates = 0
+
+        self.search_region: Rect = None
+        """ The window relative region that user images are searched for in, once calibrated """
+        self._search_region_generation: int = None
+        self._calibrations: dict[tuple[int, int], Rect] = {}
+        """ Calibrated search regions, by window (width, height) """
+        self._next_calibration_time = 0.0
 
         # populate the users
         self.load_users_as_necessary()
@@ -39,95 +81,295 @@ class LocatorUserImages():
 
         return ret
 
-    def load_users_as_necessary(self) -> list[User]:
-        # get a list of already loaded user images
-        already_loaded: set[str] = {user.voice_icon_path_name_ext for user in self.users}
-        
-        # load any new images
-        images_from_dir = self._load_images_from_dir(self.user_images_dir)
-        for path_name_ext in images_from_dir:
-            if path_name_ext not in already_loaded:
-                self.users.append(User(path_name_ext))
+    @property
+    def users(self) -> tuple[User, ...]:
+        """ The current snapshot of the loaded users """
+        return self.registry.snapshot()
+
+    def load_users_as_necessary(self) -> tuple[User, ...]:
+        def add_new_users(users: tuple[User, ...]) -> tuple[User, ...]:
+            # get a list of already loaded user images
+            already_loaded: set[str] = {user.voice_icon_path_name_ext for user in users}
+
+            # load any new images
+            images_from_dir = self._load_images_from_dir(self.user_images_dir)
+            new_users = [User.load(path_name_ext) for path_name_ext in images_from_dir if path_name_ext not in already_loaded]
+            return users + tuple(new_users)
 
-        return self.users
+        return self.registry.update(add_new_users)
     
     def check_user_images_files(self):
         """ Checks for new (or stale) user image files and reloads or unloads them, as necessary. """
         # check for any users that need to be reloaded or unloaded
-        for user in copy.copy(self.users):
-            update_status = user.update_as_necessary()
-            if update_status == UserUpdateStatus.unloaded:
-                self.users.remove(user)
+        def reload_users(users: tuple[User, ...]) -> list[User]:
+            ret: list[User] = []
+            for user in users:
+                update_status = user.check_file()
+                if update_status == UserUpdateStatus.reloaded:
+                    ret.append(User.load(user.voice_icon_path_name_ext))
+                elif update_status == UserUpdateStatus.unchanged:
+                    ret.append(user)
+            return ret
+
+        self.registry.update(reload_users)
         
         # check for any image files that don't yet have a matching user
         self.load_users_as_necessary()
 
-    def grab_user_images_slice(self) -> tuple[np.ndarray, Pxy]:
-        x = 116 # user images are typically at x=116
-        y = 0
-        w = 50 # user images are very small
-        h = self.discord_frame_grabber.monitor_area.height
-        reg = Rect.from_xywh(x, y, w, h)
+    default_search_x = 116
+    """ user images are typically at x=116 """
+    default_search_width = 50
+    """ user images are very small """
+    calibration_width = 320
+    """ how much of the left side of the window to search when calibrating (the server list and channel sidebar) """
+    calibration_margin = Pxy(4, 10)
+    """ margin around the calibrated region, in pixels horizontally and in rows (or icon heights) above the first user """
+    calibration_retry_interval = 5.0
+    """ seconds to wait before calibrating again after failing to find any users """
 
-        slice = self.discord_frame_grabber.grab(reg)
+    def grab_user_images_slice(self) -> tuple[np.ndarray, Pxy]:
+        reg = self._get_search_region()
+        slice = self.discord_frame_grabber.grab(reg, pooled=True)
 
         return slice, reg.top_left
 
-    def locate_users_annotations(self) -> tuple[list[User], np.ndarray]:
+    def _get_search_region(self) -> Rect:
+        """ Get the window relative region to search for users in. The region
+        is calibrated once per window size, and looked up again whenever the
+        window geometry changes. Until calibration succeeds, a column at
+        default_search_x spanning the window height is used. """
+        grabber = self.discord_frame_grabber
+        generation = grabber.generation
+        if self.search_region is None or generation != self._search_region_generation:
+            self._search_region_generation = generation
+            window_size = (grabber.width, grabber.height)
+            self.search_region = self._calibrations.get(window_size)
+            if self.search_region is None and time.monotonic() >= self._next_calibration_time:
+                self.search_region = self.calibrate()
+                if self.search_region is not None:
+                    self._calibrations[window_size] = self.search_region
+                else:
+                    self._next_calibration_time = time.monotonic() + self.calibration_retry_interval
+
+        if self.search_region is None:
+            return Rect.from_xywh(self.default_search_x, 0, self.default_search_width, grabber.height)
+        return self.search_region
+
+    def invalidate_calibration(self):
+        """ Forget the search region for the current window size, so that it's calibrated again on the next search. """
+        self._calibrations.pop((self.discord_frame_grabber.width, self.discord_frame_grabber.height), None)
+        self.search_region = None
+
+        # the layout changed, so the row predictions are stale too
+        self._last_regions.clear()
+
+    @tracing.traced()
+    def calibrate(self) -> Rect | None:
+        """ Finds the region of the window that users can occupy by searching
+        the whole left side of the window for every user image.
+
+        Returns
+        -------
+        search_region: Rect | None
+            The window relative region around the found users, or None if
+            no users could be found. It extends from calibration_margin.y
+            rows above the first user to the bottom of the window, since
+            the list grows downwards as users join.
+        """
+        grabber = self.discord_frame_grabber
+        window_height = grabber.height
+        calibration_reg = Rect.from_xywh(0, 0, min(self.calibration_width, grabber.width), window_height)
+        slice = grabber.grab(calibration_reg, pooled=True)
+
+        matches: list[Rect] = []
+        for user in self.registry.snapshot():
+            match = self._find_voice_icon(slice, user.cropped_voice_icon)
+            if match is not None:
+                matches.append(match)
+        if len(matches) == 0:
+            return None
+
+        # learn the rows from these matches, to know how far up to extend the region
+        matches = sorted(matches, key=lambda r: r.y)
+        self._learn_rows(matches)
+        row_height = self.row_pitch if self.row_pitch is not None else (matches[0].height * 2)
+
+        left = min(m.x for m in matches) - self.calibration_margin.x
+        right = max(m.bottom_right.x for m in matches) + self.calibration_margin.x
+        top = min(m.y for m in matches) - self.calibration_margin.y * row_height
+        bottom = window_height
+        search_region = Rect.from_ltrb(left, top, right, bottom).clip(0, calibration_reg.width, 0, window_height)
+        print(f"Calibrated user search region: {search_region}")
+
+        return search_region
+
+    def _find_voice_icon(self, slice: np.ndarray, voice_icon: np.ndarray) -> Rect | None:
+        """ Finds the first exact match for the voice_icon within the slice. """
+        # Start by matching off the corner pixels (and center pixel).
+        # We do this for speed, since np.equal and np.logical_and are much
+        # faster than scanning through the entire slice for the user image.
+        # The comparisons are done in place, in buffers that are reused between calls.
+        w, h = voice_icon.shape[1], voice_icon.shape[0]
+        sample_pixels = Rect.from_xywh(0, 0, w, h).get_corners_xy(True)
+        sample_pixels.append(Pxy(int(w/2), int(h/2)))
+        search_shape = (slice.shape[0]-h+1, slice.shape[1]-w+1, slice.shape[2])
+        if search_shape[0] <= 0 or search_shape[1] <= 0:
+            return None
+        matches = self.buffer_pool.get("locator_matches", search_shape, bool)
+        pixel_matches = self.buffer_pool.get("locator_pixel_matches", search_shape, bool)
+        for i, pixel in enumerate(sample_pixels):
+            shifted_slice = slice[pixel.y:slice.shape[0]-(h-pixel.y-1), pixel.x:slice.shape[1]-(w-pixel.x-1)]
+            if i == 0:
+                np.equal(shifted_slice, voice_icon[pixel.y, pixel.x], out=matches)
+            else:
+                np.equal(shifted_slice, voice_icon[pixel.y, pixel.x], out=pixel_matches)
+                np.logical_and(matches, pixel_matches, out=matches)
+        all_channels_match = self.buffer_pool.get("locator_all_channels_match", search_shape[:2], bool)
+        np.logical_and.reduce(matches, axis=2, out=all_channels_match)
+        matching_coords = np.nonzero(all_channels_match)
+
+        # Search for exact matches to our approximate matches
+        x_searches, y_searches = matching_coords[1].tolist(), matching_coords[0].tolist()
+        for x, y in zip(x_searches, y_searches):
+            if np.array_equal(slice[y:y+h, x:x+w], voice_icon):
+                return Rect.from_xywh(x, y, w, h)
+        return None
+
+    def _find_voice_icon_in_rows(self, slice: np.ndarray, window_offset: Pxy, voice_icon: np.ndarray, last_region: Rect | None) -> Rect | None:
+        """ Checks for an exact match for the voice_icon at the position it was
+        last found, and then at each of the predicted rows. """
+        w, h = voice_icon.shape[1], voice_icon.shape[0]
+
+        # check where the user was last found
+        if last_region is not None:
+            x, y = last_region.x - window_offset.x, last_region.y - window_offset.y
+            if x >= 0 and y >= 0 and x+w <= slice.shape[1] and y+h <= slice.shape[0]:
+                if np.array_equal(slice[y:y+h, x:x+w], voice_icon):
+                    return Rect.from_xywh(x, y, w, h)
+
+        # check every predicted row at once
+        if self.row_pitch is None:
+            return None
+        x = self.row_anchor.x - window_offset.x
+        first_y = (self.row_anchor.y - window_offset.y) % self.row_pitch
+        num_rows = (slice.shape[0] - h - first_y) // self.row_pitch + 1
+        if x < 0 or x+w > slice.shape[1] or num_rows <= 0:
+            return None
+        # view each row as one entry of a (num_rows, h, w, channels) array, without copying
+        s0, s1, s2 = slice.strides
+        rows = np.lib.stride_tricks.as_strided(slice[first_y:, x:], shape=(num_rows, h, w, slice.shape[2]),
+                                               strides=(s0 * self.row_pitch, s0, s1, s2), writeable=False)
+        pixel_matches = self.buffer_pool.get("locator_row_matches", rows.shape, bool)
+        np.equal(rows, voice_icon, out=pixel_matches)
+        row_matches = np.flatnonzero(pixel_matches.reshape(num_rows, -1).all(axis=1))
+        if len(row_matches) == 0:
+            return None
+
+        return Rect.from_xywh(x, first_y + int(row_matches[0]) * self.row_pitch, w, h)
+
+    def _learn_rows(self, regions: list[Rect]):
+        """ Updates the row pitch and row anchor from the given confirmed (window relative) user regions. """
+        if len(regions) == 0:
+            return
+        anchor = regions[0].top_left
+        icon_height = regions[0].height
+
+        # all users in the list share the same x position
+        if any(r.x != anchor.x for r in regions):
+            self.row_pitch, self.row_anchor = None, None
+            return
+
+        # Users without a user image also take up rows, so the distance between
+        # two located users can be any multiple of the pitch. Use the largest
+        # distance that divides all of them.
+        pitch = 0
+        for region in regions[1:]:
+            pitch = math.gcd(pitch, region.y - anchor.y)
+        if pitch == 0:
+            # Only one user, so we can't learn the pitch. Keep the existing
+            # pitch if this user is still on one of its rows.
+            if self.row_pitch is not None and self.row_anchor.x == anchor.x and (anchor.y - self.row_anchor.y) % self.row_pitch == 0:
+                return
+            self.row_pitch = None
+        elif pitch < icon_height:
+            # Rows can't overlap. This isn't one evenly spaced list (eg there are
+            # users in more than one channel), so don't try to predict rows.
+            self.row_pitch = None
+        else:
+            self.row_pitch = pitch
+        self.row_anchor = anchor
+
+    @tracing.traced()
+    def locate_users_annotations(self, annotate: bool = True) -> tuple[tuple[User, ...], np.ndarray]:
         """ Locates user images within the discord window.
+
+        Parameters
+        ----------
+        annotate : bool, optional
+            If False, then the annotated slice isn't drawn and None is returned in its place.
         
         Returns
         -------
-        users: list[User]
+        users: tuple[User, ...]
             Each found user with a visible user image corresponding
-            to one of images in self.user_images_dir.
+            to one of images in self.user_images_dir, with its
+            voice_icon_region set, sorted top to bottom.
         annotated_slice: np.ndarray
             An small annotated screenshot of discord with the user
             images highlighted.
         """
+        users, annotated_slice = self._locate_users_annotations(annotate)
+
+        # If nobody could be found, then maybe the layout changed. Calibrate and try again.
+        if len(users) == 0 and self.search_region is not None:
+            self.invalidate_calibration()
+            users, annotated_slice = self._locate_users_annotations(annotate)
+
+        return users, annotated_slice
+
+    def _locate_users_annotations(self, annotate: bool) -> tuple[tuple[User, ...], np.ndarray]:
+        users = self.registry.snapshot()
         slice, window_offset = self.grab_user_images_slice()
+
+        # forget the predictions for users that were reloaded or unloaded
+        current_keys = {user.key for user in users}
+        for key in [key for key in self._last_regions if key not in current_keys]:
+            del self._last_regions[key]
         newly_located_users: list[User] = []
-        annotated_slice = slice.copy()
-
-        for user in self.users:
-            voice_icon = user.cropped_voice_icon
-
-            # Start by matching off the corner pixels (and center pixel).
-            # We do this for speed, since np.where and np.logical_and are much
-            # faster than scanning through the entire slice for the user image.
-            w, h = voice_icon.shape[1], voice_icon.shape[0]
-            sample_pixels = Rect.from_xywh(0, 0, w, h).get_corners_xy(True)
-            sample_pixels.append(Pxy(int(w/2), int(h/2)))
-            matches: list[bool] = []
-            for i, pixel in enumerate(sample_pixels):
-                shifted_slice = slice[pixel.y:slice.shape[0]-(h-pixel.y-1), pixel.x:slice.shape[1]-(w-pixel.x-1)]
-                if i == 0:
-                    matches = shifted_slice == voice_icon[pixel.y, pixel.x]
-                else:
-                    matches = np.logical_and(matches, shifted_slice == voice_icon[pixel.y, pixel.x])
-            matching_coords = np.where(matches)
-
-            # Search for exact matches to our approximate matches
-            x_searches, y_searches = matching_coords[1].tolist(), matching_coords[0].tolist()
-            match: Rect = None
-            for x, y in zip(x_searches, y_searches):
-                if x+w <= slice.shape[1] and y+h <= slice.shape[0]:
-                    if np.all(slice[y:y+h, x:x+w] == voice_icon):
-                        match = Rect.from_xywh(x, y, w, h)
-                        break
+        annotated_slice = slice.copy() if annotate else None
+
+        is_full_scan_call = (self.full_scan_interval > 0) and (self._num_locates % self.full_scan_interval == 0)
+        self._num_locates += 1
+
+        for user in users:
+            with tracing.span("locate_user", user=user.voice_icon_name_ext):
+                last_region = self._last_regions.get(user.key, _never_searched)
+                match: Rect = None
+                is_predicted_absent = False
+                if self.predict_rows and last_region is not _never_searched:
+                    match = self._find_voice_icon_in_rows(slice, window_offset, user.cropped_voice_icon, last_region)
+                    is_predicted_absent = (match is None) and (last_region is None) and (self.row_pitch is not None)
+                skip_full_scan = is_predicted_absent and not is_full_scan_call
+                if match is None and not skip_full_scan:
+                    match = self._find_voice_icon(slice, user.cropped_voice_icon)
+                self._last_regions[user.key] = (match + window_offset) if match is not None else None
             if match is None:
                 continue
 
             # Add the match to our return value
             window_rel_match = match + window_offset
-            user.voice_icon_region = window_rel_match
-            newly_located_users.append(user)
+            newly_located_users.append(user.with_region(window_rel_match))
 
             # Debugging: draw the rectangle on large_image
-            magenta = (255,0,255)
-            annotated_slice = cv2.rectangle(annotated_slice, match.top_left.astuple(), match.bottom_right.astuple(), magenta, thickness=2)
+            if annotate:
+                magenta = (255,0,255)
+                annotated_slice = cv2.rectangle(annotated_slice, match.top_left.astuple(), match.bottom_right.astuple(), magenta, thickness=2)
         
         # Sort users by their y-location
-        newly_located_users = sorted(newly_located_users, key=lambda u: u.voice_icon_region.y)
+        newly_located_users = tuple(sorted(newly_located_users, key=lambda u: u.voice_icon_region.y))
+
+        # Update the row predictions for the next call
+        if self.predict_rows:
+            self._learn_rows([u.voice_icon_region for u in newly_located_users])
         
         return newly_located_users, annotated_slice
\ No newline at end of file
@@ -0,0 +1,185 @@
+import os
+import sys
+import threading
+import time
+from typing import Callable
+
+sys.path.append(os.path.normpath(os.path.join(__file__, "..", "..")))
+import tracing
+
+
+class MuteState():
+    """ Cached model of whether we're muted in discord.
+
+    Looking at the mic icon means capturing the screen, and usually bringing
+    discord to the foreground, so this remembers the state that we last set
+    and the state that we last observed, along with the window generation at
+    that time. get() answers from the cache while the window hasn't changed
+    and the cached state is younger than max_age, and only observes the mic
+    otherwise.
+
+    After set() the new state is assumed, and verified verify_delay seconds
+    later on a timer thread. If the verification can't see the mic, then the
+    assumed state is forgotten, so that the next get() looks at it. run() observes the mic every poll_interval
+    seconds while discord is in the foreground, so that changes made in
+    discord itself (eg clicking the mic) are noticed within poll_interval
+    seconds, or within max_age seconds at worst (when the mic can't be seen
+    without activating discord). """
+
+    def __init__(self, observe: Callable[[bool], bool | None], generation_getter: Callable[[], int],
+                 max_age: float = 5.0, verify_delay: float = 0.25, poll_interval: float = 1.0,
+                 clock: Callable[[], float] = time.monotonic):
+        """
+        Parameters
+        ----------
+        observe : Callable[[bool], bool | None]
+            Looks at the mic and returns True if muted. Called with may_activate,
+            which is True if it's alright to bring discord to the foreground to
+            see the mic. Returns None if the mic can't be seen.
+        generation_getter : Callable[[], int]
+            Gets the discord window generation (see DiscordWindowFinder.generation).
+        """
+        self.observe = observe
+        self.generation_getter = generation_getter
+        self.max_age = max_age
+        self.verify_delay = verify_delay
+        self.poll_interval = poll_interval
+        self.clock = clock
+        self.on_change: Callable[[bool], None] = None
+        """ Called with the new state when an observation differs from the state we expected """
+
+        self.last_set: bool = None
+        self.last_set_time: float = None
+        self.last_set_generation: int = None
+        self.last_observed: bool = None
+        self.last_observed_time: float = None
+        self.last_observed_generation: int = None
+        self.num_observations = 0
+        self.num_sets = 0
+        self._lock = threading.RLock()
+        self._verify_timer: threading.Timer = None
+
+    @property
+    def expected(self) -> bool | None:
+        """ The state we believe discord is in: whichever of the last set
+        or last observed state is newer, regardless of age. """
+        with self._lock:
+            if self.last_set_time is not None and (self.last_observed_time is None or self.last_set_time >= self.last_observed_time):
+                return self.last_set
+            return self.last_observed
+
+    def get_cached(self) -> bool | None:
+        """ Get the cached state, or None if it's expired or the window has changed. """
+        with self._lock:
+            now, generation = self.clock(), self.generation_getter()
+            if self.last_set_time is not None and (self.last_observed_time is None or self.last_set_time >= self.last_observed_time):
+                if generation == self.last_set_generation and now - self.last_set_time < self.max_age:
+                    return self.last_set
+            elif self.last_observed_time is not None:
+                if generation == self.last_observed_generation and now - self.last_observed_time < self.max_age:
+                    return self.last_observed
+            return None
+
+    def get(self, may_activate: bool = True) -> bool | None:
+        """ Get whether we're muted, from the cache if possible, otherwise by looking at the mic.
+
+        Returns
+        -------
+        is_muted: bool | None
+            True if muted, or None if the state isn't cached and the mic can't be seen.
+        """
+        cached = self.get_cached()
+        if cached is not None:
+            return cached
+        return self.refresh(may_activate)
+
+    @tracing.traced()
+    def refresh(self, may_activate: bool = False, notify: bool = True) -> bool | None:
+        """ Looks at the mic and updates the cache. Returns the observed state,
+        or None if the mic couldn't be seen (or the state was set while looking,
+        which makes the observation stale). If notify is True, then on_change
+        is called when the observed state isn't the expected state. """
+        # The observation is as old as the start of the capture. Note when it started,
+        # so that it doesn't overwrite a state that was set while capturing.
+        with self._lock:
+            start_time, num_sets = self.clock(), self.num_sets
+        generation = self.generation_getter()
+        observed = self.observe(may_activate)
+        if observed is None:
+            return None
+
+        with self._lock:
+            if self.num_sets != num_sets:
+                # the state was changed while we were looking, so this observation is already stale
+                return None
+            expected = self.expected
+            self.last_observed = observed
+            self.last_observed_time = start_time
+            self.last_observed_generation = generation
+            self.num_observations += 1
+
+        if notify and expected is not None and expected != observed:
+            print(f"Mute state changed outside of our control: muted={observed}")
+            if self.on_change is not None:
+                self.on_change(observed)
+        return observed
+
+    def set(self, muted: bool, on_mismatch: Callable[[bool, bool], None] = None):
+        """ Records that we just changed the state (eg by clicking the mic), and schedules a verification.
+
+        Parameters
+        ----------
+        muted : bool
+            The state we changed to.
+        on_mismatch : Callable[[bool, bool], None]
+            If given, then this is called instead of on_change when the verification
+            sees a different state, with the state we wanted and the observed state.
+            Called from the timer thread.
+        """
+        with self._lock:
+            self.last_set = muted
+            self.last_set_time = self.clock()
+            self.num_sets += 1
+            self.last_set_generation = self.generation_getter()
+
+            if self._verify_timer is not None:
+                self._verify_timer.cancel()
+            self._verify_timer = threading.Timer(self.verify_delay, self._verify, args=(muted, on_mismatch, self.num_sets))
+            self._verify_timer.daemon = True
+            self._verify_timer.start()
+
+    def invalidate(self):
+        """ Forget the cached state, so that the next get() looks at the mic. """
+        with self._lock:
+            self.last_set, self.last_set_time, self.last_set_generation = None, None, None
+            self.last_observed, self.last_observed_time, self.last_observed_generation = None, None, None
+
+    def _verify(self, muted: bool, on_mismatch: Callable[[bool, bool], None], num_sets: int):
+        try:
+            observed = self.refresh(may_activate=False, notify=(on_mismatch is None))
+            if observed is None:
+                # We can't see the mic (discord is in the background), so we don't
+                # know if the change worked. Don't keep assuming that it did.
+                with self._lock:
+                    if self.num_sets == num_sets:
+                        self.invalidate()
+            elif on_mismatch is not None and observed != muted:
+                on_mismatch(muted, observed)
+        except Exception as ex:
+            print("Failed to verify the mute state: " + repr(ex))
+
+    def run(self):
+        """ Watches for changes to the mute state. Runs forever, call from a dedicated thread. """
+        while True:
+            time.sleep(self.poll_interval)
+
+            # don't look again if something else looked recently
+            with self._lock:
+                last_time = max(t for t in (self.last_set_time, self.last_observed_time, -self.poll_interval) if t is not None)
+            if self.clock() - last_time < self.poll_interval:
+                continue
+
+            try:
+                self.refresh(may_activate=False)
+            except Exception as ex:
+                print("Failed to observe the mute state: " + repr(ex))
@@ -0,0 +1,166 @@
+import ctypes
+import ctypes.wintypes
+import os
+import sys
+import threading
+
+import numpy as np
+
+sys.path.append(os.path.normpath(os.path.join(__file__, "..", "..")))
+import tracing
+from discord_interaction.BufferPool import BufferPool
+
+
+class _BITMAPINFOHEADER(ctypes.Structure):
+    _fields_ = [
+        ("biSize", ctypes.wintypes.DWORD),
+        ("biWidth", ctypes.wintypes.LONG),
+        ("biHeight", ctypes.wintypes.LONG),
+        ("biPlanes", ctypes.wintypes.WORD),
+        ("biBitCount", ctypes.wintypes.WORD),
+        ("biCompression", ctypes.wintypes.DWORD),
+        ("biSizeImage", ctypes.wintypes.DWORD),
+        ("biXPelsPerMeter", ctypes.wintypes.LONG),
+        ("biYPelsPerMeter", ctypes.wintypes.LONG),
+        ("biClrUsed", ctypes.wintypes.DWORD),
+        ("biClrImportant", ctypes.wintypes.DWORD),
+    ]
+
+
+class ScreenCapture():
+    """ Captures regions of the virtual screen directly into numpy buffers.
+
+    On Windows this copies the screen with GDI into a reusable BGRA buffer and
+    converts that into the caller's RGB buffer, so that no per-frame images
+    are allocated. Elsewhere (or if GDI fails) it falls back to PIL's ImageGrab. """
+
+    SRCCOPY = 0x00CC0020
+    CAPTUREBLT = 0x40000000
+    DIB_RGB_COLORS = 0
+    DPI_AWARENESS_CONTEXT_PER_MONITOR_AWARE = -3
+
+    def __init__(self, buffer_pool: BufferPool = None):
+        self.buffer_pool = buffer_pool if buffer_pool is not None else BufferPool()
+        self._user32, self._gdi32 = self._load_win32()
+        self._mem_dc: int = None
+        self._bitmap: int = None
+        self._bitmap_size: tuple[int, int] = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _load_win32():
+        """ Loads our own instances of user32 and gdi32, so that we can declare
+        pointer sized return types without affecting anybody else's windll. """
+        if not hasattr(ctypes, "WinDLL"):
+            return None, None
+        user32, gdi32 = ctypes.WinDLL("user32"), ctypes.WinDLL("gdi32")
+        HANDLE = ctypes.c_void_p
+
+        user32.GetDC.restype = HANDLE
+        user32.GetDC.argtypes = [HANDLE]
+        user32.ReleaseDC.argtypes = [HANDLE, HANDLE]
+        gdi32.CreateCompatibleDC.restype = HANDLE
+        gdi32.CreateCompatibleDC.argtypes = [HANDLE]
+        gdi32.CreateCompatibleBitmap.restype = HANDLE
+        gdi32.CreateCompatibleBitmap.argtypes = [HANDLE, ctypes.c_int, ctypes.c_int]
+        gdi32.SelectObject.restype = HANDLE
+        gdi32.SelectObject.argtypes = [HANDLE, HANDLE]
+        gdi32.DeleteObject.argtypes = [HANDLE]
+        gdi32.DeleteDC.argtypes = [HANDLE]
+        gdi32.BitBlt.argtypes = [HANDLE, ctypes.c_int, ctypes.c_int, ctypes.c_int, ctypes.c_int,
+                                 HANDLE, ctypes.c_int, ctypes.c_int, ctypes.wintypes.DWORD]
+        gdi32.GetDIBits.argtypes = [HANDLE, HANDLE, ctypes.wintypes.UINT, ctypes.wintypes.UINT,
+                                    ctypes.c_void_p, ctypes.c_void_p, ctypes.wintypes.UINT]
+        if hasattr(user32, "SetThreadDpiAwarenessContext"):
+            user32.SetThreadDpiAwarenessContext.restype = HANDLE
+            user32.SetThreadDpiAwarenessContext.argtypes = [HANDLE]
+
+        return user32, gdi32
+
+    @tracing.traced()
+    def grab_into(self, ltrb: tuple[int, int, int, int], out: np.ndarray) -> np.ndarray:
+        """ Captures the given virtual screen region into out.
+
+        Parameters
+        ----------
+        ltrb : tuple[int, int, int, int]
+            The left, top, right and bottom of the region, in virtual screen coordinates.
+        out : np.ndarray
+            An HxWx3 uint8 buffer to write the RGB pixels to, where H and W are the height
+            and width of the region.
+
+        Returns
+        -------
+        out: np.ndarray
+            The given buffer.
+        """
+        left, top, right, bottom = ltrb
+        width, height = right - left, bottom - top
+        if out.shape != (height, width, 3):
+            raise ValueError(f"Expected a buffer of shape {(height, width, 3)}, but got {out.shape}")
+        if width == 0 or height == 0:
+            return out
+
+        if self._user32 is not None:
+            bgra = self.buffer_pool.get("screen_capture_bgra", (height, width, 4))
+            if self._grab_gdi(left, top, width, height, bgra):
+                np.copyto(out, bgra[:, :, 2::-1])
+                return out
+
+        from PIL import ImageGrab
+        with tracing.span("ImageGrab.grab", width=width, height=height):
+            np.copyto(out, np.asarray(ImageGrab.grab(ltrb, all_screens=True))[:, :, :3])
+        return out
+
+    def _grab_gdi(self, left: int, top: int, width: int, height: int, bgra: np.ndarray) -> bool:
+        user32, gdi32 = self._user32, self._gdi32
+
+        with self._lock, tracing.span("BitBlt", width=width, height=height):
+            # Match PIL's ImageGrab, which captures in physical pixels
+            prev_dpi_context = None
+            if hasattr(user32, "SetThreadDpiAwarenessContext"):
+                prev_dpi_context = user32.SetThreadDpiAwarenessContext(self.DPI_AWARENESS_CONTEXT_PER_MONITOR_AWARE)
+
+            screen_dc = user32.GetDC(None)
+            try:
+                if not screen_dc:
+                    return False
+
+                # reuse the bitmap from the last capture if it's the same size
+                if self._bitmap_size != (width, height):
+                    self._release_bitmap()
+                    self._mem_dc = gdi32.CreateCompatibleDC(screen_dc)
+                    self._bitmap = gdi32.CreateCompatibleBitmap(screen_dc, width, height)
+                    if not self._mem_dc or not self._bitmap:
+                        self._release_bitmap()
+                        return False
+                    gdi32.SelectObject(self._mem_dc, self._bitmap)
+                    self._bitmap_size = (width, height)
+
+                if not gdi32.BitBlt(self._mem_dc, 0, 0, width, height, screen_dc, left, top, self.SRCCOPY | self.CAPTUREBLT):
+                    return False
+
+                header = _BITMAPINFOHEADER()
+                header.biSize = ctypes.sizeof(_BITMAPINFOHEADER)
+                header.biWidth = width
+                header.biHeight = -height # top-down rows
+                header.biPlanes = 1
+                header.biBitCount = 32
+                header.biCompression = 0 # BI_RGB
+                num_lines = gdi32.GetDIBits(screen_dc, self._bitmap, 0, height, bgra.ctypes.data,
+                                            ctypes.byref(header), self.DIB_RGB_COLORS)
+                return num_lines == height
+
+            finally:
+                if screen_dc:
+                    user32.ReleaseDC(None, screen_dc)
+                if prev_dpi_context is not None:
+                    user32.SetThreadDpiAwarenessContext(prev_dpi_context)
+
+    def _release_bitmap(self):
+        # delete the dc first, so that the bitmap is no longer selected into it
+        if self._mem_dc:
+            self._gdi32.DeleteDC(self._mem_dc)
+        if self._bitmap:
+            self._gdi32.DeleteObject(self._bitmap)
+        self._mem_dc, self._bitmap, self._bitmap_size = None, None, None
@@ -1,3 +1,4 @@
+import dataclasses
 import os
 import sys
 from enum import Enum
@@ -15,40 +16,53 @@ class UpdateStatus(Enum):
     unloaded = 2
 
 
+@dataclasses.dataclass(frozen=True, eq=False)
 class User():
-    def __init__(self, voice_icon_path_name_ext: str, voice_icon_region: Rect = None):
-        self.voice_icon_path_name_ext = voice_icon_path_name_ext
-        """ path/name.ext of the voice icon for this user """
-        self.voice_icon_region = voice_icon_region
-        """ location of the voice icon for this user,
-        in screen coordinates, relative to the discord window """
-
-        self.voice_icon = Image.open(self.voice_icon_path_name_ext)
-        self._cropped_voice_icon: np.ndarray = None
-        self.voice_icon_name_ext = os.path.basename(self.voice_icon_path_name_ext)
-        self.voice_icon_path = os.path.dirname(self.voice_icon_path_name_ext)
-        self.voice_icon_mtime = os.path.getmtime(self.voice_icon_path_name_ext)
-    
+    """ Immutable record of a user's voice icon, and optionally where it was located.
+    Use load() to read one from its image file, and with_region() to record where it was found. """
+
+    voice_icon_path_name_ext: str
+    """ path/name.ext of the voice icon for this user """
+    voice_icon_mtime: float
+    """ modification time of the voice icon file when it was loaded """
+    cropped_voice_icon: np.ndarray
+    """ the part of the voice icon to match against (read only) """
+    voice_icon_region: Rect = None
+    """ location of the voice icon for this user,
+    in screen coordinates, relative to the discord window """
+
+    @classmethod
+    def load(cls, voice_icon_path_name_ext: str) -> "User":
+        voice_icon_mtime = os.path.getmtime(voice_icon_path_name_ext)
+        cropped_voice_icon = np.array(Image.open(voice_icon_path_name_ext))[6:18, 6:18, :3].copy()
+        cropped_voice_icon.setflags(write=False)
+        return cls(voice_icon_path_name_ext, voice_icon_mtime, cropped_voice_icon)
+
+    @property
+    def voice_icon_name_ext(self) -> str:
+        return os.path.basename(self.voice_icon_path_name_ext)
+
     @property
-    def cropped_voice_icon(self) -> np.ndarray:
-        if self._cropped_voice_icon is None:
-            self._cropped_voice_icon = np.array(self.voice_icon)[6:18, 6:18, :3]
-        return self._cropped_voice_icon
+    def voice_icon_path(self) -> str:
+        return os.path.dirname(self.voice_icon_path_name_ext)
 
-    def update_as_necessary(self) -> UpdateStatus:
-        """ Reloads or unloads the image for this user from the source image file, as necessary. """
+    @property
+    def key(self) -> tuple[str, float]:
+        """ Identifies this version of this user's voice icon """
+        return (self.voice_icon_path_name_ext, self.voice_icon_mtime)
+
+    def with_region(self, voice_icon_region: Rect) -> "User":
+        """ Get a copy of this user, located at the given region. """
+        return dataclasses.replace(self, voice_icon_region=voice_icon_region)
+
+    def check_file(self) -> UpdateStatus:
+        """ Checks whether the source image file for this user has been changed or removed.
+        Use load() to get the updated user. """
         if not os.path.isfile(self.voice_icon_path_name_ext):
-            self.voice_icon = None
             return UpdateStatus.unloaded
 
         new_mod_time = os.path.getmtime(self.voice_icon_path_name_ext)
         if new_mod_time > self.voice_icon_mtime:
-            self.voice_icon = Image.open(self.voice_icon_path_name_ext)
-            self._cropped_voice_icon = None
-            self.voice_icon_mtime = new_mod_time
             return UpdateStatus.reloaded
-        
-        return UpdateStatus.unchanged
-    
 
-        
\ No newline at end of file
+        return UpdateStatus.unchanged
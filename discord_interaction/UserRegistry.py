@@ -0,0 +1,37 @@
+import os
+import sys
+import threading
+from typing import Callable, Iterable
+
+sys.path.append(os.path.normpath(os.path.join(__file__, "..", "..")))
+from discord_interaction.User import User
+
+
+class UserRegistry():
+    """ Copy-on-write registry of the loaded users.
+
+    Readers call snapshot() to get the current users without taking a lock.
+    A snapshot is an immutable tuple of immutable User records, so it can be
+    iterated while the registry is being updated. Writers build a new tuple
+    and publish it by swapping the reference, which is atomic. Writers are
+    serialized with a lock so that concurrent updates aren't lost. """
+
+    def __init__(self, users: Iterable[User] = ()):
+        self._snapshot: tuple[User, ...] = tuple(users)
+        self._write_lock = threading.Lock()
+
+    def snapshot(self) -> tuple[User, ...]:
+        return self._snapshot
+
+    def update(self, updater: Callable[[tuple[User, ...]], Iterable[User]]) -> tuple[User, ...]:
+        """ Replaces the users with updater(current users).
+
+        Returns
+        -------
+        users: tuple[User, ...]
+            The new snapshot.
+        """
+        with self._write_lock:
+            snapshot = tuple(updater(self._snapshot))
+            self._snapshot = snapshot
+        return snapshot
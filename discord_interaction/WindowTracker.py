@@ -0,0 +1,207 @@
+import ctypes
+import ctypes.wintypes
+import os
+import sys
+import threading
+import time
+from typing import Callable
+
+sys.path.append(os.path.normpath(os.path.join(__file__, "..", "..")))
+import tracing
+from geometry import Pxy, Rect
+
+
+class Win32WindowLayer():
+    """ The operating system calls used by WindowTracker, for Windows.
+
+    Any object with the same methods can be given to the WindowTracker
+    instead, for example to test it without a real window. """
+
+    EVENT_OBJECT_LOCATIONCHANGE = 0x800B
+    OBJID_WINDOW = 0
+    WINEVENT_OUTOFCONTEXT = 0
+
+    def get_window_rect(self, hwnd: int) -> Rect | None:
+        """ Get the window's region in virtual screen coordinates, or None if the window doesn't exist. """
+        rect = ctypes.wintypes.RECT()
+        if not ctypes.windll.user32.GetWindowRect(hwnd, ctypes.pointer(rect)):
+            return None
+        return Rect.from_ltrb(rect.left, rect.top, rect.right, rect.bottom)
+
+    def get_monitors(self) -> list[Rect]:
+        """ Get the region of each monitor in virtual screen coordinates. """
+        import screeninfo
+
+        return [Rect.from_xywh(m.x, m.y, m.width, m.height) for m in screeninfo.get_monitors()]
+
+    def start_change_notifications(self, hwnd: int, callback: Callable[[], None]) -> bool:
+        """ Calls callback from a background thread whenever the given window
+        is moved or resized. The notifications stop once the window is closed.
+
+        Returns
+        -------
+        started: bool
+            False if notifications aren't available.
+        """
+        user32 = ctypes.windll.user32
+        pid = ctypes.wintypes.DWORD()
+        user32.GetWindowThreadProcessId(hwnd, ctypes.byref(pid))
+        if pid.value == 0:
+            return False
+
+        WinEventProc = ctypes.WINFUNCTYPE(None, ctypes.wintypes.HANDLE, ctypes.wintypes.DWORD, ctypes.wintypes.HWND,
+                                          ctypes.wintypes.LONG, ctypes.wintypes.LONG, ctypes.wintypes.DWORD, ctypes.wintypes.DWORD)
+
+        def on_event(hook, event, event_hwnd, id_object, id_child, event_thread, event_time):
+            if event_hwnd == hwnd and id_object == self.OBJID_WINDOW:
+                callback()
+
+        started = threading.Event()
+        hooked: list[bool] = []
+
+        def run():
+            # The hook delivers its events through this thread's message queue,
+            # so the hook must be registered and pumped from the same thread.
+            proc = WinEventProc(on_event)
+            hook = user32.SetWinEventHook(self.EVENT_OBJECT_LOCATIONCHANGE, self.EVENT_OBJECT_LOCATIONCHANGE, 0,
+                                          proc, pid.value, 0, self.WINEVENT_OUTOFCONTEXT)
+            hooked.append(bool(hook))
+            started.set()
+            if not hook:
+                return
+
+            msg = ctypes.wintypes.MSG()
+            while user32.IsWindow(hwnd):
+                # wait for up to a second at a time, so that we notice when the window is closed
+                user32.MsgWaitForMultipleObjects(0, None, False, 1000, 0x04FF) # QS_ALLINPUT
+                while user32.PeekMessageW(ctypes.byref(msg), None, 0, 0, 1): # PM_REMOVE
+                    user32.TranslateMessage(ctypes.byref(msg))
+                    user32.DispatchMessageW(ctypes.byref(msg))
+            user32.UnhookWinEvent(hook)
+
+        threading.Thread(target=run, name="WindowTrackerEvents", daemon=True).start()
+        started.wait()
+        return hooked[0]
+
+
+class WindowTracker():
+    """ Caches the discord window's region and the monitor layout.
+
+    The generation counter is increased whenever either of them actually
+    changes, so that hot paths can check for changes by comparing integers
+    instead of making OS calls.
+
+    The window region is re-read when the OS notifies us that the window
+    moved or resized, or at least every poll_interval seconds as a fallback
+    (hooked_poll_interval once notifications are running). The monitor
+    layout is re-read whenever the window region changes, and at least
+    every monitor_poll_interval seconds. """
+
+    def __init__(self, hwnd_getter: Callable[[], int | None], os_layer: Win32WindowLayer = None,
+                 poll_interval: float = 0.1, hooked_poll_interval: float = 1.0, monitor_poll_interval: float = 2.0,
+                 clock: Callable[[], float] = time.monotonic):
+        self.hwnd_getter = hwnd_getter
+        self.os_layer = os_layer if os_layer is not None else Win32WindowLayer()
+        self.poll_interval = poll_interval
+        self.hooked_poll_interval = hooked_poll_interval
+        self.monitor_poll_interval = monitor_poll_interval
+        self.clock = clock
+
+        self._generation = 0
+        self._window_region: Rect | None = None
+        self._monitors: list[Rect] = []
+        self._hwnd: int = None
+        self._is_hooked = False
+        self._is_dirty = True
+        self._next_poll_time = 0.0
+        self._next_monitor_poll_time = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def generation(self) -> int:
+        """ Increases every time the window region or monitor layout changes. """
+        self._refresh_as_necessary()
+        return self._generation
+
+    @property
+    def window_region(self) -> Rect | None:
+        """ The discord window's region in virtual screen coordinates, or None if there is no window. """
+        self._refresh_as_necessary()
+        return self._window_region
+
+    @property
+    def monitors(self) -> list[Rect]:
+        """ The region of each monitor in virtual screen coordinates. """
+        self._refresh_as_necessary()
+        return self._monitors
+
+    def notify_changed(self):
+        """ Marks the cached values as stale, so that they're re-read on next access.
+        Safe to call from any thread. """
+        self._is_dirty = True
+
+    def _refresh_as_necessary(self):
+        if not self._is_dirty and self.clock() < self._next_poll_time:
+            return
+        with self._lock:
+            now = self.clock()
+            if not self._is_dirty and now < self._next_poll_time:
+                return # another thread refreshed while we were waiting
+            self._is_dirty = False
+            self._refresh(now)
+
+    @tracing.traced()
+    def _refresh(self, now: float):
+        # start listening for changes to the window, if we aren't already
+        hwnd = self.hwnd_getter()
+        if hwnd != self._hwnd:
+            self._hwnd = hwnd
+            self._is_hooked = False
+            if hwnd is not None:
+                try:
+                    self._is_hooked = self.os_layer.start_change_notifications(hwnd, self.notify_changed)
+                except Exception as ex:
+                    print("Failed to start window change notifications: " + repr(ex))
+        self._next_poll_time = now + (self.hooked_poll_interval if self._is_hooked else self.poll_interval)
+
+        # update the window region
+        window_region = self.os_layer.get_window_rect(hwnd) if hwnd is not None else None
+        is_changed = window_region != self._window_region
+
+        # update the monitors
+        monitors = self._monitors
+        if is_changed or now >= self._next_monitor_poll_time:
+            monitors = self.os_layer.get_monitors()
+            self._next_monitor_poll_time = now + self.monitor_poll_interval
+            is_changed = is_changed or (monitors != self._monitors)
+
+        if is_changed:
+            self._window_region = window_region
+            self._monitors = monitors
+            self._generation += 1
+
+    def get_matching_monitor_idx_area(self, screen_location: Pxy) -> tuple[int, Rect]:
+        """ Finds the monitor that contains the given virtual screen pixel.
+
+        Parameters
+        ----------
+        screen_location : Pxy
+            The virtual screen pixel to find a matching monitor for.
+
+        Returns
+        -------
+        monitor_idx: int
+            The index of the monitor that contains the screen location.
+        monitor_area: Rect
+            The monitor's area on the virtual screen.
+
+        Raises
+        ------
+        RuntimeError
+            IF the given screen_location isn't located within any of the found monitors
+        """
+        for i, area in enumerate(self.monitors):
+            if area.contains(screen_location):
+                return i, area
+
+        raise RuntimeError(f"Could not find a monitor containing virtual screen location {screen_location}")
@@ -1,11 +1,9 @@
 import os
 import sys
-import time
+import threading
 from datetime import datetime, timedelta
+from typing import TYPE_CHECKING, Callable
 
-import cv2 as cv
-import numpy as np
-from PIL import Image
 from pynput.keyboard import Controller as Keyboard
 from pynput.keyboard import Key
 from pynput.mouse import Button
@@ -13,11 +11,14 @@ from pynput.mouse import Controller as Mouse
 
 root = os.path.normpath(os.path.join(__file__, "..", ".."))
 sys.path.append(root)
-from discord_interaction.DiscordWindowFinder import DiscordWindowFinder
-from discord_interaction.LocatorUserImages import LocatorUserImages
-from discord_interaction.User import User
-from Fresh import Fresh
-from geometry import Pxy, Rect
+import tracing
+from discord_interaction.Keybind import Keybind
+from geometry import Pxy
+
+if TYPE_CHECKING:
+    # only needed for type hints, and slow to import (see _LazyDiscordAPI)
+    from discord_interaction.DiscordAPI import DiscordAPI
+    from discord_interaction.User import User
 
 app_images_dir = os.path.join(root, "media")
 user_images_dir = os.path.join(root, "media/user_pics")
@@ -25,128 +26,92 @@ user_images_dir = os.path.join(root, "media/user_pics")
 keyboard = Keyboard()
 mouse = Mouse()
 
+# Discord's "Toggle Mute" and "Toggle Deafen" keybinds (Settings > Keybinds), eg "ctrl+shift+m"
+mute_keybind = Keybind.parse(os.environ["DISCORDCONTROL_MUTE_KEYBIND"]) if os.environ.get("DISCORDCONTROL_MUTE_KEYBIND") else None
+deafen_keybind = Keybind.parse(os.environ["DISCORDCONTROL_DEAFEN_KEYBIND"]) if os.environ.get("DISCORDCONTROL_DEAFEN_KEYBIND") else None
+
+# How to mute: "keybind" sends the mute keybind, and only clicks the mic when the result
+# doesn't match what we expected. "vision" always clicks the mic.
+mute_backend = os.environ.get("DISCORDCONTROL_MUTE_BACKEND", "keybind" if mute_keybind is not None else "vision")
+if mute_backend not in ["keybind", "vision"]:
+    raise ValueError(f"Unknown DISCORDCONTROL_MUTE_BACKEND \"{mute_backend}\", expected \"keybind\" or \"vision\"")
+if mute_backend == "keybind" and mute_keybind is None:
+    raise ValueError("DISCORDCONTROL_MUTE_KEYBIND must be set to use the keybind mute backend")
+
+
+class _LazyDiscordAPI():
+    """ Stand-in for the DiscordAPI instance that builds it on first use.
+
+    Constructing the DiscordAPI finds the Discord window and loads every user
+    image, and importing it pulls in cv2, PIL, pywinauto and screeninfo. None of
+    that is needed for the server to start listening, so it's deferred until
+    the first attribute access. """
 
-class _DiscordAPI():
     def __init__(self, app_images_dir: str, user_images_dir: str):
-        self.app_images_dir = app_images_dir
-        self.user_images_dir = user_images_dir
-        self.discord_window = DiscordWindowFinder()
-        self.user_locator = LocatorUserImages(self.discord_window, user_images_dir)
-
-        self.users: Fresh[list[User]] = Fresh(lambda: self.user_locator.locate_users_annotations()[0])
-        self.mic_center_for_grabbing: Fresh[Pxy] = Fresh(self._get_mic_center_for_grabbing, expiration_ref_obj=self.discord_window._get_discord_region)
-        self.mic_image: np.ndarray = None
-        self.mic_mask: np.ndarray = None
-
-    def update(self):
-        """ Allows all Fresh values to update, as necesssary.
-        Useful for maintaining a consistent state during evaluation.
-        Should be called at the start of an evaluation. """
-        # unlock all Fresh values
-        self.users.unlock()
-
-        # if the window isn't visible, then we activate it to bring it to the foreground
-        if self.num_users == 0:
-            self.discord_window.activate_window()
-
-        # mark all Fresh values as needing to update
-        self.users.needs_refresh = True
-
-        # lock all Fresh values
-        self.users.lock()
-    
+        self._app_images_dir = app_images_dir
+        self._user_images_dir = user_images_dir
+        self._instance: "DiscordAPI" = None
+        self._lock = threading.Lock()
+
     @property
-    def num_users(self):
-        return len(self.users.get())
-    
-    def get_user_by_index(self, idx: int) -> User:
-        if self.num_users == 0:
-            return None
-        idx %= self.num_users
-        return self.users.get()[idx]
-    
-    def get_user_by_name(self, partial_name: str) -> User:
-        for user in self.users.get():
-            print(user.voice_icon_path_name_ext)
-            print(user.voice_icon_name_ext)
-            if partial_name in user.voice_icon_name_ext:
-                return user
-        return None
-    
-    def _get_mic_center_for_grabbing(self):
-        radius = Pxy(30, 30)
-
-        # grab a portion of the screen roughly corresponding to where the mic is
-        voice_status_corner_approx = self.discord_window.virtual_coord(Pxy(80, -152), 'bl')
-        mic_center_approx = voice_status_corner_approx + Pxy(152, 116)
-        mic_region_approx = Rect(mic_center_approx - radius, mic_center_approx + radius)
-        mic_image = self.discord_window.grab(mic_region_approx - self.discord_window.window_corner())
-
-        # convert to black and white
-        thresholded = np.zeros(mic_image.shape[:2], dtype=mic_image.dtype)
-        thresholded[np.where(mic_image[:, :, 0] > 150)] = 255
-
-        # find the best matching location
-        if self.mic_image is None:
-            mic_path = os.path.normpath(os.path.join(self.app_images_dir, "mic_thresholded.png"))
-            mic_mask_path = os.path.normpath(os.path.join(self.app_images_dir, "mic_mask.png"))
-            self.mic_image = np.array(Image.open(mic_path))[:, :, 0].squeeze()
-            self.mic_mask = np.array(Image.open(mic_mask_path))[:, :, 0].squeeze()
-        match_matrix = cv.matchTemplate(thresholded, self.mic_image, cv.TM_SQDIFF, mask=self.mic_mask)
-        _, _, match_loc_xy, _ = cv.minMaxLoc(match_matrix)
-        match_loc = Pxy(match_loc_xy[0], match_loc_xy[1])
-
-        # use this value as an offset from the expected center
-        match_ul = mic_center_approx - radius + match_loc
-        return match_ul + (Pxy(self.mic_image.shape[1], self.mic_image.shape[0]) / 2)
-    
-    def is_muted(self) -> bool:
-        # activate the discord window
-        self.discord_window.activate_window()
-
-        # grab the mic image
-        mic_center = self.mic_center_for_grabbing.get()
-        mic_region = Rect(mic_center - Pxy(13, 13), mic_center + Pxy(13, 13))
-        mic_image = self.discord_window.grab(mic_region - self.discord_window.window_corner())
-
-        # return true if red
-        thresholded = np.zeros_like(mic_image)
-        thresholded[np.where(mic_image > 150)] = 1
-        r, g, b = np.sum(thresholded[:,:,0]), np.sum(thresholded[:,:,1]), np.sum(thresholded[:,:,2])
-        if r > (g + b):
-            return True
-        return False
+    def is_initialized(self) -> bool:
+        return self._instance is not None
 
-    
-global last_mouse_over_user_pos
-dapi = _DiscordAPI(app_images_dir, user_images_dir)
-last_mouse_over_user_pos: Pxy = None
+    def get(self) -> "DiscordAPI":
+        """ Returns the DiscordAPI instance, building it if necessary.
+        A failed build (eg discord isn't running) is retried on the next call. """
+        if self._instance is None:
+            with self._lock:
+                if self._instance is None:
+                    from discord_interaction.DiscordAPI import DiscordAPI
+                    self._instance = DiscordAPI(self._app_images_dir, self._user_images_dir)
+        return self._instance
+
+    def __getattr__(self, name: str):
+        return getattr(self.get(), name)
 
 
-def mouse_over_user(user_idx_or_name: int | str):
+global last_mouse_over_user_pos
+global last_deafened
+dapi = _LazyDiscordAPI(app_images_dir, user_images_dir)
+last_mouse_over_user_pos: Pxy = None
+last_deafened: bool = False
+""" The deafen state we last set. Discord can't be seen deafening, so assume we start out undeafened. """
+muted_before_deafen: bool = None
+_mute_lock = threading.RLock()
+""" Serializes changes to the mute and deafen states, which can also come from the mismatch fallback """
+on_mute_fallback: Callable[[bool], None] = None
+""" If set, then this is called with the wanted mute state when the mute keybind didn't take effect,
+instead of clicking the mic right away (from the verification thread). The server uses
+this to queue the click with its other actions, so that they don't move the mouse at the same time. """
+
+
+@tracing.traced()
+def mouse_over_user(user_idx_or_name: int | str) -> "User":
     global last_mouse_over_user_pos
 
     # activate the discord window
     dapi.discord_window.activate_window()
 
     # get the user
-    stop_search_time = datetime.now() + timedelta(seconds=0.5)
-    while True:
-        # close any existing ui elements
-        keyboard.tap(Key.esc)
-        keyboard.tap(Key.esc)
-
-        # get the user
-        if isinstance(user_idx_or_name, str):
-            user = dapi.get_user_by_name(user_idx_or_name)
-        else:
-            user = dapi.get_user_by_index(user_idx_or_name)
-        if user is not None:
-            break
+    with tracing.span("esc_tap_spin"):
+        stop_search_time = datetime.now() + timedelta(seconds=0.5)
+        while True:
+            # close any existing ui elements
+            keyboard.tap(Key.esc)
+            keyboard.tap(Key.esc)
+
+            # get the user
+            if isinstance(user_idx_or_name, str):
+                user = dapi.get_user_by_name(user_idx_or_name)
+            else:
+                user = dapi.get_user_by_index(user_idx_or_name)
+            if user is not None:
+                break
         
-        # stop after 0.5 seconds
-        if datetime.now() > stop_search_time:
-            break
+            # stop after 0.5 seconds
+            if datetime.now() > stop_search_time:
+                break
     if user is None:
         raise ValueError(f"User with name or index {user_idx_or_name} can't be found!")
 
@@ -155,7 +120,10 @@ def mouse_over_user(user_idx_or_name: int | str):
     last_mouse_over_user_pos = (user_loc + Pxy(5, 5))
     mouse.position = last_mouse_over_user_pos.astuple()
 
+    return user
 
+
+@tracing.traced()
 def set_user_volume(user_idx_or_name: int | str, volume_0_100: int, dont_open_context_menu: bool = False):
     if not dont_open_context_menu:
         mouse_over_user(user_idx_or_name)
@@ -170,7 +138,7 @@ def set_user_volume(user_idx_or_name: int | str, volume_0_100: int, dont_open_co
     # get the location of the volume slider
     # X is between 17 and 170
     x_range = 170 - 17
-    x_rel_pos = 17 + np.clip(np.round([x_range / 100 * volume_0_100]), 0, x_range)
+    x_rel_pos = 17 + min(max(round(x_range / 100 * volume_0_100), 0), x_range)
     # Y is always at relative position 257
     y_rel_pos = 257
 
@@ -180,24 +148,99 @@ def set_user_volume(user_idx_or_name: int | str, volume_0_100: int, dont_open_co
     mouse.click(Button.left)
     
 
-def mute():
+def _set_muted(muted: bool):
+    with _mute_lock:
+        if mute_backend == "keybind":
+            _set_muted_keybind(muted)
+        else:
+            _set_muted_vision(muted)
+
+
+def _set_muted_vision(muted: bool):
+    # determine if we're currently muted, from the cached state if possible
+    if dapi.mute_state.get() == muted:
+        return
+
     # activate the discord window
     dapi.discord_window.activate_window()
 
-    # determine if we're currently muted
-    if not dapi.is_muted():
-        mouse.position = dapi.mic_center_for_grabbing.get().astuple()
-        mouse.click(Button.left)
+    # click the mic
+    mouse.position = dapi.mic_center_for_grabbing.get().astuple()
+    mouse.click(Button.left)
+    dapi.mute_state.set(muted)
+
+
+def _set_muted_keybind(muted: bool):
+    # The keybind toggles the mute, so we need to know the current state.
+    # Use the cached state, or else look at the mic (activating discord if necessary).
+    is_muted = dapi.mute_state.get(may_activate=True)
+    if is_muted is None:
+        # the mic couldn't be seen
+        _set_muted_vision(muted)
+        return
+    if is_muted == muted:
+        return
+
+    mute_keybind.press(keyboard)
+    dapi.mute_state.set(muted, on_mismatch=_on_mute_keybind_mismatch)
+
+
+def _on_mute_keybind_mismatch(muted: bool, observed: bool):
+    print(f"Mute keybind didn't take effect (muted={observed}), clicking the mic instead")
+    if on_mute_fallback is not None:
+        on_mute_fallback(muted)
+    else:
+        set_muted_with_vision(muted)
+
+
+@tracing.traced()
+def set_muted_with_vision(muted: bool):
+    """ Mutes or unmutes by clicking the mic, regardless of the mute backend. """
+    with _mute_lock:
+        _set_muted_vision(muted)
+
+
+@tracing.traced()
+def mute():
+    _set_muted(True)
 
 
+@tracing.traced()
 def unmute():
-    # activate the discord window
-    dapi.discord_window.activate_window()
+    _set_muted(False)
+
+
+def _set_deafened(deafened: bool):
+    global last_deafened
+    global muted_before_deafen
+
+    if deafen_keybind is None:
+        raise RuntimeError("DISCORDCONTROL_DEAFEN_KEYBIND must be set to deafen")
+
+    with _mute_lock:
+        if last_deafened == deafened:
+            return
+        deafen_keybind.press(keyboard)
+        last_deafened = deafened
+
+        # discord mutes while deafened, and restores the previous mute state after
+        if deafened:
+            muted_before_deafen = dapi.mute_state.expected
+            dapi.mute_state.set(True)
+        elif muted_before_deafen is not None:
+            dapi.mute_state.set(muted_before_deafen)
+        else:
+            dapi.mute_state.invalidate()
+
+
+@tracing.traced()
+def deafen():
+    _set_deafened(True)
+
 
-    # determine if we're currently muted
-    if dapi.is_muted():
-        mouse.position = dapi.mic_center_for_grabbing.get().astuple()
-        mouse.click(Button.left)
+@tracing.traced()
+def undeafen():
+    _set_deafened(False)
     
 
 if __name__ == "__main__":
@@ -1,6 +1,3 @@
-import numpy as np
-
-
 class Pxy():
 	""" Represents a single point (typically a pixel). """
 	def __init__(self, x: int , y: int):
@@ -8,8 +5,8 @@ class Pxy():
 		self.y = y
 
 	def clip(self, min_x: int, max_x: int, min_y: int, max_y: int) -> "Pxy":
-		x = np.clip(self.x, min_x, max_x)
-		y = np.clip(self.y, min_y, max_y)
+		x = min(max(self.x, min_x), max_x)
+		y = min(max(self.y, min_y), max_y)
 		return Pxy(x, y)
 	
 	def astuple(self) -> tuple[int, int]:
@@ -85,7 +82,7 @@ class Rect():
 	
 	def clip(self, min_x: int, max_x: int, min_y: int, max_y: int) -> "Rect":
 		top_left = self.top_left.clip(min_x, max_x, min_y, max_y)
-		min_x2, min_y2 = np.max([min_x, top_left.x]), np.max([min_y, top_left.y])
+		min_x2, min_y2 = max(min_x, top_left.x), max(min_y, top_left.y)
 		bottom_right = self.bottom_right.clip(min_x2, max_x, min_y2, max_y)
 		return Rect(top_left, bottom_right)
 	
@@ -1,18 +1,33 @@
 import concurrent.futures
+import json
+import os
 import socket
 import time
 from datetime import datetime, timedelta
 
 import discord_interaction.dapi as dapi
+import tracing
+from InputFilter import InputFilter
 from pynput.keyboard import Controller, Key
+from StatePublisher import StatePublisher
 
 UDP_IP = "127.0.0.1"
-UDP_PORTs = [6331, 6332, 6333]
+UDP_PORTs = [6331, 6332, 6333, 6335]
+SUBSCRIBE_PORT = 6334
+""" Controllers send "subscribe" or "unsubscribe" here to receive state pushes (from this port) """
 
 global action_queue
-messages: list[tuple[int, str]] = []
+messages: list[tuple[int, bytes, tuple[str, int]]] = []
+sockets: dict[int, socket.socket] = {}
 keyboard = Controller()
 action_queue: list["Action"] = []
+publisher: StatePublisher = None
+input_filters: dict[int, InputFilter] = {
+    6333: InputFilter(num_steps=100), # volume, one step per slider position
+}
+""" Filters for the ports with analog inputs, so that noise doesn't become actions """
+filter_acks: dict[int, list[tuple[int, tuple[str, int], int]]] = {port: [] for port in input_filters}
+""" The acks for the messages that were suppressed by each input filter """
 
 
 global last_user_select_time
@@ -24,15 +39,19 @@ last_user_select_idx = 0
 
 
 class Action():
-    def __init__(self, action_type: str, data: float = 0):
+    def __init__(self, action_type: str, data: float = 0, acks: list[tuple[int, tuple[str, int], int]] = None):
         self.action_type = action_type
         self.data = data
+        self.acks = acks if acks is not None else []
+        """ The (port, address, sequence number) of each message to acknowledge once this action is evaluated """
     
     def __repr__(self):
         return "A{%s,%f}" % (self.action_type, self.data)
     
     
 def watch_user_images():
+    # The first pass also builds the (lazily constructed) discord api, so that
+    # the cost is paid here instead of by the first action.
     while True:
         try:
             dapi.dapi.user_locator.check_user_images_files()
@@ -42,8 +61,65 @@ def watch_user_images():
         time.sleep(10)
 
 
+def watch_mute_state():
+    # Notices when we're muted or unmuted from within discord, and tells the controllers
+    while True:
+        try:
+            mute_state = dapi.dapi.mute_state
+            mute_state.on_change = lambda muted: publisher.publish(muted=muted)
+            mute_state.run()
+        except Exception as ex:
+            print(repr(ex))
+        
+        time.sleep(10)
+
+
+def parse_message(data: bytes) -> tuple[int | None, float]:
+    """ Parses a control message, either "<value>" or "<sequence number>:<value>".
+
+    Returns
+    -------
+    seq: int | None
+        The sequence number, if there was one.
+    value: float
+        The control value.
+    """
+    text = data.decode("utf-8")
+    if ":" in text:
+        seq, value = text.split(":", 1)
+        return int(seq), float(value)
+    return None, float(text)
+
+
+def send_ack(port: int, addr: tuple[str, int], seq: int, is_ok: bool):
+    """ Acknowledges the message with the given sequence number, from the port it was received on. """
+    message = json.dumps({"ack": seq, "port": port, "ok": is_ok}).encode("utf-8")
+    try:
+        sockets[port].sendto(message, addr)
+    except OSError as ex:
+        print(f"Failed to send ack to {addr}: {repr(ex)}")
+
+
+def pop_actions(action_type: str) -> list["Action"]:
+    """ Removes all actions of the given type from the action queue, and returns them. """
+    global action_queue
+
+    popped = [a for a in action_queue if a.action_type == action_type]
+    action_queue = list(filter(lambda a: a.action_type != action_type, action_queue))
+    return popped
+
+
+def ack_actions(actions: list["Action"], is_ok: bool):
+    for action in actions:
+        for port, addr, seq in action.acks:
+            send_ack(port, addr, seq, is_ok)
+
+
 def select_user(user_idx: int):
-    dapi.mouse_over_user(user_idx)
+    user = dapi.mouse_over_user(user_idx)
+
+    user_name = os.path.splitext(user.voice_icon_name_ext)[0]
+    publisher.publish(user_idx=user_idx % dapi.dapi.num_users, user_name=user_name)
 
 
 def select_next_user():
@@ -71,7 +147,8 @@ def adjust_user_volume(data: float):
     last_user_volume_adj_time = curr
     dont_open_context_menu = diff < 3
 
-    dapi.set_user_volume(last_user_select_idx, int(data * 100), dont_open_context_menu)
+    dapi.set_user_volume(last_user_select_idx, round(data * 100), dont_open_context_menu)
+    publisher.publish(volume=round(data * 100))
 
 
 def evaluate_actions():
@@ -85,73 +162,190 @@ def evaluate_actions():
         last_action = action_queue[-1]
 
         if last_action.action_type == "mute":
-            action_queue = list(filter(lambda a: a.action_type != last_action.action_type, action_queue))
+            actions = pop_actions(last_action.action_type)
+            pop_actions("mute_fallback") # superseded by this newer request
+            is_ok = False
             try:
-                if last_action.data < 0.5:
-                    dapi.mute()
-                else:
-                    dapi.unmute()
+                with tracing.span("action", action=last_action):
+                    if last_action.data < 0.5:
+                        dapi.mute()
+                    else:
+                        dapi.unmute()
+                publisher.publish(muted=last_action.data < 0.5)
+                is_ok = True
             except Exception as ex:
                 print(last_action.action_type + ": " + repr(ex))
                 pass
+            ack_actions(actions, is_ok)
+
+        elif last_action.action_type == "mute_fallback":
+            pop_actions(last_action.action_type)
+            try:
+                with tracing.span("action", action=last_action):
+                    dapi.set_muted_with_vision(last_action.data < 0.5)
+                publisher.publish(muted=last_action.data < 0.5)
+            except Exception as ex:
+                print(last_action.action_type + ": " + repr(ex))
+                pass
+
+        elif last_action.action_type == "deafen":
+            actions = pop_actions(last_action.action_type)
+            is_ok = False
+            try:
+                with tracing.span("action", action=last_action):
+                    if last_action.data < 0.5:
+                        dapi.deafen()
+                    else:
+                        dapi.undeafen()
+                publisher.publish(deafened=last_action.data < 0.5)
+                is_ok = True
+            except Exception as ex:
+                print(last_action.action_type + ": " + repr(ex))
+                pass
+            ack_actions(actions, is_ok)
 
         elif last_action.action_type == "next_user":
-            action_queue = list(filter(lambda a: a.action_type != last_action.action_type, action_queue))
+            actions = pop_actions(last_action.action_type)
+            is_ok = False
             try:
-                select_next_user()
+                with tracing.span("action", action=last_action):
+                    select_next_user()
+                is_ok = True
             except Exception as ex:
                 print(last_action.action_type + ": " + repr(ex))
                 pass
+            ack_actions(actions, is_ok)
 
         elif last_action.action_type == "set_volume":
-            action_queue = list(filter(lambda a: a.action_type != last_action.action_type, action_queue))
+            actions = pop_actions(last_action.action_type)
+            is_ok = False
             try:
-                adjust_user_volume(last_action.data)
+                with tracing.span("action", action=last_action):
+                    adjust_user_volume(last_action.data)
+                is_ok = True
             except Exception as ex:
                 print(last_action.action_type + ": " + repr(ex))
                 pass
+            ack_actions(actions, is_ok)
+
+
+def queue_mute_fallback(muted: bool):
+    """ Clicks the mic with the other actions, when the mute keybind didn't take effect. """
+    action_queue.append(Action("mute_fallback", 0 if muted else 1))
 
 
-def listen(ipaddr: str, port: int):
+def bind(ipaddr: str, port: int) -> socket.socket:
     sock = socket.socket(socket.AF_INET, # Internet
                          socket.SOCK_DGRAM) # UDP
     sock.bind((ipaddr, port))
+    return sock
 
+
+def listen(sock: socket.socket, port: int):
     while True:
-        data, addr = sock.recvfrom(1024) # buffer size is 1024 bytes
-        messages.append((port, data))
+        try:
+            data, addr = sock.recvfrom(1024) # buffer size is 1024 bytes
+        except ConnectionResetError:
+            # Windows reports when one of our acks or pushes wasn't received
+            continue
+        messages.append((port, data, addr))
+
+
+def poll_input_filters(messages_by_port: dict[int, tuple[float, list[tuple[int, tuple[str, int], int]]]]):
+    """ Adds the values from the input filters that have settled to messages_by_port. """
+    for port, input_filter in input_filters.items():
+        value = input_filter.poll()
+        if value is not None:
+            messages_by_port[port] = (value, filter_acks[port])
+            filter_acks[port] = []
+        elif not input_filter.is_pending and len(filter_acks[port]) > 0:
+            # the suppressed values are already represented by the last emitted value
+            for ack_port, addr, seq in filter_acks[port]:
+                send_ack(ack_port, addr, seq, True)
+            filter_acks[port] = []
+
+
+def handle_subscription(data: bytes, addr: tuple[str, int]):
+    request = data.decode("utf-8").strip()
+    if request == "subscribe":
+        publisher.subscribe(addr)
+    elif request == "unsubscribe":
+        publisher.unsubscribe(addr)
+    else:
+        print(f"Unknown subscription request from {addr}: {request}")
 
 
 if __name__ == "__main__":
+    # dump the trace on ctrl+break (or SIGUSR1), when tracing is enabled
+    if tracing.is_enabled():
+        tracing.install_signal_handler()
+
+    # bind all the ports before starting any threads, so that they're ready for sending acks and pushes
+    for port in UDP_PORTs + [SUBSCRIBE_PORT]:
+        sockets[port] = bind(UDP_IP, port)
+    publisher = StatePublisher(sockets[SUBSCRIBE_PORT])
+    dapi.on_mute_fallback = queue_mute_fallback
+
     # We can use a with statement to ensure threads are cleaned up promptly
-    with concurrent.futures.ThreadPoolExecutor(max_workers=len(UDP_PORTs)+2) as executor:
+    with concurrent.futures.ThreadPoolExecutor(max_workers=len(sockets)+4) as executor:
         # Start each listener
-        futures = [executor.submit(listen, UDP_IP, port) for port in UDP_PORTs]
+        futures = [executor.submit(listen, sock, port) for port, sock in sockets.items()]
         futures.append(executor.submit(evaluate_actions))
         futures.append(executor.submit(watch_user_images))
+        futures.append(executor.submit(watch_mute_state))
+        futures.append(executor.submit(publisher.run))
         
         # Wait until all futures have completed
         while True:
-            if len(messages) == 0:
+            # Keep only the latest message for each port. The superseded
+            # messages are acknowledged along with the message that replaced them.
+            messages_by_port: dict[int, tuple[float, list[tuple[int, tuple[str, int], int]]]] = {}
+            poll_input_filters(messages_by_port)
+
+            if len(messages) == 0 and len(messages_by_port) == 0:
                 time.sleep(0.02)
                 continue
 
-            messages_by_port: dict[int, str] = {}
             while len(messages) > 0:
-                port, data = messages.pop()
-                messages_by_port[port] = data
+                port, data, addr = messages.pop(0)
+
+                if port == SUBSCRIBE_PORT:
+                    handle_subscription(data, addr)
+                    continue
+
+                try:
+                    seq, value = parse_message(data)
+                except ValueError as ex:
+                    print(f"Bad message on port {port} from {addr}: {repr(ex)}")
+                    continue
+
+                new_acks = [(port, addr, seq)] if seq is not None else []
+                if port in input_filters:
+                    filter_acks[port] += new_acks
+                    value = input_filters[port].filter(value)
+                    if value is None:
+                        continue
+                    new_acks, filter_acks[port] = filter_acks[port], []
+
+                _, acks = messages_by_port.get(port, (None, []))
+                acks += new_acks
+                messages_by_port[port] = (value, acks)
             
             for port in messages_by_port:
-                data = messages_by_port[port]
-                data = float(data.decode("utf-8"))
-                print("received message on port %d: %f" % (port, data))
+                data, acks = messages_by_port[port]
+                if port in input_filters:
+                    print("received message on port %d: %f (%d suppressed)" % (port, data, input_filters[port].num_suppressed))
+                else:
+                    print("received message on port %d: %f" % (port, data))
 
                 try:
                     if port == 6331:
-                        action_queue.append(Action("mute", data))
+                        action_queue.append(Action("mute", data, acks))
                     if port == 6332:
-                        action_queue.append(Action("next_user"))
+                        action_queue.append(Action("next_user", acks=acks))
                     if port == 6333:
-                        action_queue.append(Action("set_volume", data))
+                        action_queue.append(Action("set_volume", data, acks))
+                    if port == 6335:
+                        action_queue.append(Action("deafen", data, acks))
                 except Exception as ex:
-                    print(ex)
\ No newline at end of file
+                    print(ex)
@@ -0,0 +1,81 @@
+import os
+import random
+import sys
+
+root = os.path.normpath(os.path.join(__file__, "..", ".."))
+sys.path.append(root)
+from InputFilter import InputFilter
+
+
+class FakeClock():
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def feed(input_filter: InputFilter, clock: FakeClock, values: list[float], interval: float = 0.02) -> list[float]:
+    """ Feeds the values at the given interval, polling in between. Returns the emitted values. """
+    emitted = []
+    for value in values:
+        clock.now += interval
+        for result in [input_filter.poll(), input_filter.filter(value)]:
+            if result is not None:
+                emitted.append(result)
+    return emitted
+
+
+def settle(input_filter: InputFilter, clock: FakeClock, duration: float = 1.0) -> list[float]:
+    """ Polls without any new values. Returns the emitted values. """
+    emitted = []
+    for _ in range(int(duration / 0.02)):
+        clock.now += 0.02
+        result = input_filter.poll()
+        if result is not None:
+            emitted.append(result)
+    return emitted
+
+
+def test_jitter_is_suppressed():
+    clock = FakeClock()
+    input_filter = InputFilter(clock=clock)
+    rand = random.Random(0)
+    emitted = feed(input_filter, clock, [0.503 + rand.uniform(-0.01, 0.01) for _ in range(200)])
+    # the noise stops when the control stops changing
+    emitted += feed(input_filter, clock, [0.503])
+    emitted += settle(input_filter, clock)
+
+    assert len(emitted) <= 2
+    assert input_filter.num_emitted == len(emitted)
+    assert input_filter.num_emitted + input_filter.num_suppressed == input_filter.num_received
+
+
+def test_big_changes_are_emitted_immediately():
+    clock = FakeClock()
+    input_filter = InputFilter(clock=clock)
+    assert feed(input_filter, clock, [0.2]) == [0.2]
+    assert feed(input_filter, clock, [0.8]) != []
+
+
+def test_settles_on_the_last_value():
+    clock = FakeClock()
+    input_filter = InputFilter(clock=clock)
+    feed(input_filter, clock, [0.5 + 0.3 * i / 49 for i in range(50)])
+    emitted = settle(input_filter, clock)
+    assert emitted[-1] == 0.8
+    assert input_filter.poll() is None
+
+    # a value within the hysteresis of the current position still settles on the nearest position
+    feed(input_filter, clock, [0.807] * 10)
+    assert settle(input_filter, clock) == [0.81]
+
+
+def test_suppressed_count_isnt_negative():
+    clock = FakeClock()
+    input_filter = InputFilter(clock=clock)
+    emitted = feed(input_filter, clock, [0.0, 1.0])
+    emitted += settle(input_filter, clock)
+    assert emitted[0] == 0.0 and emitted[-1] == 1.0
+    assert input_filter.num_received == 2
+    assert input_filter.num_suppressed == 0
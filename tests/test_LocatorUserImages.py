@@ -0,0 +1,57 @@
+import os
+import sys
+import tempfile
+
+root = os.path.normpath(os.path.join(__file__, "..", ".."))
+sys.path.append(root)
+sys.path.append(os.path.join(root, "benchmarks"))
+import synthetic_screens
+from discord_interaction.LocatorUserImages import LocatorUserImages
+
+
+def show_users(grabber: synthetic_screens.FakeFrameGrabber, icon_paths: list[str], user_count: int, column_x: int = 116):
+    column, _ = synthetic_screens.make_user_column(icon_paths, grabber.height, user_count)
+    grabber.window[:, column_x:column_x+column.shape[1]] = column
+
+
+def test_finds_users_that_join_below_the_calibrated_users():
+    with tempfile.TemporaryDirectory() as icons_dir:
+        icon_paths = synthetic_screens.make_icon_library(20, icons_dir)
+        column, _ = synthetic_screens.make_user_column(icon_paths, 1080, 1)
+        grabber = synthetic_screens.FakeFrameGrabber(column)
+        locator = LocatorUserImages(grabber, icons_dir)
+
+        # calibrate with only one user in the channel
+        users, _ = locator.locate_users_annotations(annotate=False)
+        assert len(users) == 1
+        assert locator.search_region is not None
+
+        # the rest of the users join
+        show_users(grabber, icon_paths, 20)
+        for _ in range(3):
+            users, _ = locator.locate_users_annotations(annotate=False)
+            assert len(users) == 20
+        assert [u.voice_icon_path_name_ext for u in users] == icon_paths
+
+
+def test_reloaded_users_are_forgotten_by_the_next_locate():
+    with tempfile.TemporaryDirectory() as icons_dir:
+        icon_paths = synthetic_screens.make_icon_library(5, icons_dir)
+        column, _ = synthetic_screens.make_user_column(icon_paths, 1080, 3)
+        grabber = synthetic_screens.FakeFrameGrabber(column)
+        locator = LocatorUserImages(grabber, icons_dir)
+        locator.locate_users_annotations(annotate=False)
+        old_keys = {user.key for user in locator.users}
+
+        # remove one image and touch another
+        os.remove(icon_paths[4])
+        mtime = os.path.getmtime(icon_paths[0]) + 5
+        os.utime(icon_paths[0], (mtime, mtime))
+        locator.check_user_images_files()
+        assert len(locator.users) == 4
+
+        # the file watcher doesn't touch the predictions, the locating thread updates them
+        assert set(locator._last_regions) == old_keys
+        users, _ = locator.locate_users_annotations(annotate=False)
+        assert [u.voice_icon_path_name_ext for u in users] == icon_paths[:3]
+        assert set(locator._last_regions) == {user.key for user in locator.users}
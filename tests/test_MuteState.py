@@ -0,0 +1,150 @@
+import os
+import sys
+
+root = os.path.normpath(os.path.join(__file__, "..", ".."))
+sys.path.append(root)
+from discord_interaction.MuteState import MuteState
+
+
+class FakeDiscord():
+    """ A mic that can be seen if discord is in the foreground (or may be activated). """
+
+    def __init__(self):
+        self.now = 0.0
+        self.generation = 0
+        self.is_muted = False
+        self.is_foreground = True
+        self.num_observations = 0
+        self.during_observe = None
+        """ Called in the middle of an observation, eg to change the state while capturing """
+
+    def clock(self) -> float:
+        # time passes a little with every call, so that events have distinct times
+        self.now += 0.001
+        return self.now
+
+    def observe(self, may_activate: bool) -> bool | None:
+        if not (may_activate or self.is_foreground):
+            return None
+        self.num_observations += 1
+        observed = self.is_muted
+        if self.during_observe is not None:
+            self.during_observe()
+        return observed
+
+
+def make_mute_state(discord: FakeDiscord) -> MuteState:
+    mute_state = MuteState(discord.observe, lambda: discord.generation, max_age=5.0, verify_delay=3600, clock=discord.clock)
+    mute_state.changes = []
+    mute_state.on_change = mute_state.changes.append
+    return mute_state
+
+
+def test_answers_from_cache():
+    discord = FakeDiscord()
+    mute_state = make_mute_state(discord)
+    assert mute_state.get() == False
+    assert discord.num_observations == 1
+
+    discord.now += 4
+    assert mute_state.get() == False
+    assert discord.num_observations == 1
+
+
+def test_cache_expires_with_age_or_window_changes():
+    discord = FakeDiscord()
+    mute_state = make_mute_state(discord)
+    mute_state.get()
+
+    discord.now += 5
+    assert mute_state.get_cached() is None
+    mute_state.get()
+    assert discord.num_observations == 2
+
+    discord.generation += 1
+    assert mute_state.get_cached() is None
+    mute_state.get()
+    assert discord.num_observations == 3
+
+
+def test_set_state_is_assumed():
+    discord = FakeDiscord()
+    mute_state = make_mute_state(discord)
+    mute_state.get()
+
+    discord.now += 1
+    discord.is_muted = True
+    mute_state.set(True)
+    assert mute_state.get() == True
+    assert discord.num_observations == 1
+
+
+def test_external_changes_are_noticed():
+    discord = FakeDiscord()
+    mute_state = make_mute_state(discord)
+    mute_state.get()
+
+    discord.now += 1
+    discord.is_muted = True
+    assert mute_state.refresh() == True
+    assert mute_state.changes == [True]
+    assert mute_state.get() == True
+
+
+def test_background_observation_is_unknown():
+    discord = FakeDiscord()
+    mute_state = make_mute_state(discord)
+    discord.is_foreground = False
+    assert mute_state.get(may_activate=False) is None
+    assert mute_state.get(may_activate=True) == False
+
+
+def test_observation_started_before_a_set_is_dropped():
+    discord = FakeDiscord()
+    mute_state = make_mute_state(discord)
+    mute_state.get()
+
+    # the state is changed while capturing the mic, so the capture saw the old state
+    def mute_while_capturing():
+        discord.is_muted = True
+        discord.now += 0.1
+        mute_state.set(True)
+    discord.now += 1
+    discord.during_observe = mute_while_capturing
+    assert mute_state.refresh() is None
+
+    assert mute_state.expected == True
+    assert mute_state.get_cached() == True
+    assert mute_state.changes == []
+
+
+def set_and_verify(mute_state: MuteState, muted: bool, on_mismatch=None):
+    mute_state.verify_delay = 0
+    mute_state.set(muted, on_mismatch)
+    mute_state._verify_timer.join()
+
+
+def test_unverifiable_set_is_forgotten():
+    discord = FakeDiscord()
+    mute_state = make_mute_state(discord)
+    mute_state.get()
+
+    # a keybind in the background can't be verified, so the next get() has to look
+    discord.is_foreground = False
+    set_and_verify(mute_state, True)
+    assert mute_state.expected is None
+    assert mute_state.get_cached() is None
+    assert mute_state.get(may_activate=True) == False
+
+
+def test_mismatch_is_reported():
+    discord = FakeDiscord()
+    mute_state = make_mute_state(discord)
+    mute_state.get()
+
+    # the change didn't take effect
+    mismatches = []
+    set_and_verify(mute_state, True, lambda muted, observed: mismatches.append((muted, observed)))
+    assert mismatches == [(True, False)]
+    assert mute_state.changes == []
+    assert mute_state.expected == False
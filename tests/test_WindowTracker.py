@@ -0,0 +1,128 @@
+import os
+import sys
+
+root = os.path.normpath(os.path.join(__file__, "..", ".."))
+sys.path.append(root)
+sys.path.append(os.path.join(root, "benchmarks"))
+from discord_interaction.WindowTracker import WindowTracker
+from geometry import Pxy, Rect
+from synthetic_screens import FakeWindowLayer
+
+
+class FakeClock():
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def make_tracker(layer: FakeWindowLayer, clock: FakeClock, hwnd: int = 1) -> WindowTracker:
+    return WindowTracker(lambda: hwnd, layer, poll_interval=0.1, hooked_poll_interval=1.0,
+                         monitor_poll_interval=2.0, clock=clock)
+
+
+def test_generation_only_changes_with_the_window_or_monitors():
+    layer, clock = FakeWindowLayer(), FakeClock()
+    tracker = make_tracker(layer, clock)
+    generation = tracker.generation
+    assert tracker.window_region == layer.window_region
+
+    # re-reading values that haven't changed doesn't bump the generation
+    for _ in range(10):
+        clock.now += 5
+        assert tracker.generation == generation
+    assert layer.num_window_reads > 1
+
+    # moving the window does
+    layer.window_region = Rect.from_xywh(200, 50, 1280, 1000)
+    clock.now += 5
+    assert tracker.generation == generation + 1
+    assert tracker.window_region == layer.window_region
+
+    # so does changing the monitors
+    layer.monitors = [Rect.from_xywh(0, 0, 2560, 1440)]
+    clock.now += 5
+    assert tracker.generation == generation + 2
+    assert tracker.monitors == layer.monitors
+
+
+def test_cached_between_polls():
+    layer, clock = FakeWindowLayer(is_hookable=False), FakeClock()
+    tracker = make_tracker(layer, clock)
+    tracker.generation
+    num_reads = layer.num_window_reads
+
+    # not hooked, so the window is polled every poll_interval
+    layer.window_region = Rect.from_xywh(200, 50, 1280, 1000)
+    clock.now += 0.05
+    assert tracker.window_region != layer.window_region
+    assert layer.num_window_reads == num_reads
+    clock.now += 0.05
+    assert tracker.window_region == layer.window_region
+    assert layer.num_window_reads == num_reads + 1
+
+
+def test_hooked_poll_interval():
+    layer, clock = FakeWindowLayer(), FakeClock()
+    tracker = make_tracker(layer, clock)
+    tracker.generation
+    assert layer.num_hooks == 1
+    num_reads = layer.num_window_reads
+
+    # hooked, so the window is only polled every hooked_poll_interval
+    clock.now += 0.5
+    tracker.generation
+    assert layer.num_window_reads == num_reads
+    clock.now += 0.5
+    tracker.generation
+    assert layer.num_window_reads == num_reads + 1
+    assert layer.num_hooks == 1
+
+
+def test_notification_forces_a_reread():
+    layer, clock = FakeWindowLayer(), FakeClock()
+    tracker = make_tracker(layer, clock)
+    generation = tracker.generation
+
+    layer.window_region = Rect.from_xywh(200, 50, 1280, 1000)
+    clock.now += 0.01
+    assert tracker.generation == generation
+
+    layer.notify()
+    assert tracker.generation == generation + 1
+    assert tracker.window_region == layer.window_region
+
+
+def test_monitor_poll_interval():
+    layer, clock = FakeWindowLayer(), FakeClock()
+    tracker = make_tracker(layer, clock)
+    tracker.generation
+    num_reads = layer.num_monitor_reads
+
+    # the window is re-read every second, but the monitors only every two seconds
+    clock.now += 1
+    tracker.generation
+    assert layer.num_monitor_reads == num_reads
+    clock.now += 1
+    tracker.generation
+    assert layer.num_monitor_reads == num_reads + 1
+
+    # unless the window changes
+    layer.window_region = Rect.from_xywh(200, 50, 1280, 1000)
+    layer.notify()
+    tracker.generation
+    assert layer.num_monitor_reads == num_reads + 2
+
+
+def test_matching_monitor():
+    monitors = [Rect.from_xywh(0, 0, 1920, 1080), Rect.from_xywh(1920, 0, 1920, 1080)]
+    tracker = make_tracker(FakeWindowLayer(monitors=monitors), FakeClock())
+    assert tracker.get_matching_monitor_idx_area(Pxy(2000, 10)) == (1, monitors[1])
+
+
+def test_no_window():
+    layer, clock = FakeWindowLayer(), FakeClock()
+    tracker = make_tracker(layer, clock, hwnd=None)
+    assert tracker.window_region is None
+    assert layer.num_hooks == 0
@@ -0,0 +1,203 @@
+""" Lightweight span tracing, exported as Chrome trace-event json.
+
+Spans are recorded into a fixed size ring buffer, and can be written out with
+flush() (or on a signal, see install_signal_handler()). Load the resulting
+file in chrome://tracing or https://ui.perfetto.dev to get a timeline.
+
+Tracing is disabled by default, in which case span() and traced() cost about
+as much as a global lookup. Enable it with enable(), or by setting the
+DISCORDCONTROL_TRACE environment variable to the path to flush to.
+
+Example:
+    with tracing.span("grab"):
+        ...
+
+    @tracing.traced()
+    def get_discord_window_handle(self):
+        ...
+"""
+import collections
+import functools
+import json
+import os
+import signal
+import threading
+import time
+from typing import Callable, TypeVar
+
+F = TypeVar("F", bound=Callable)
+
+_enabled = False
+_events: collections.deque = collections.deque(maxlen=100000)
+""" Ring buffer of (name, start_us, duration_us, thread_id, args) tuples """
+_thread_names: dict[int, str] = {}
+_flush_lock = threading.RLock()
+default_path = "trace.json"
+
+
+def enable(path: str = None, capacity: int = None):
+    """ Starts recording spans.
+
+    Parameters
+    ----------
+    path : str, optional
+        The default file to flush to.
+    capacity : int, optional
+        The number of spans to keep. Older spans are dropped first.
+    """
+    global _enabled, _events, default_path
+    if path is not None:
+        default_path = path
+    if capacity is not None and capacity != _events.maxlen:
+        _events = collections.deque(_events, maxlen=capacity)
+    _enabled = True
+
+
+def disable():
+    """ Stops recording spans. Already recorded spans are kept until flushed. """
+    global _enabled
+    _enabled = False
+
+
+def is_enabled() -> bool:
+    return _enabled
+
+
+def _now_us() -> float:
+    return time.perf_counter_ns() / 1000
+
+
+def _record(name: str, start_us: float, end_us: float, args: dict):
+    tid = threading.get_ident()
+    if tid not in _thread_names:
+        _thread_names[tid] = threading.current_thread().name
+    _events.append((name, start_us, end_us - start_us, tid, args))
+
+
+class _Span():
+    __slots__ = ("name", "args", "start_us")
+
+    def __init__(self, name: str, args: dict):
+        self.name = name
+        self.args = args
+        self.start_us = 0.0
+
+    def __enter__(self) -> "_Span":
+        self.start_us = _now_us()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        _record(self.name, self.start_us, _now_us(), self.args)
+
+
+class _NullSpan():
+    __slots__ = ()
+
+    def __enter__(self) -> "_NullSpan":
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        pass
+
+
+_null_span = _NullSpan()
+
+
+def span(name: str, **args) -> _Span | _NullSpan:
+    """ Context manager that records the time spent in its body as a span.
+    Any keyword arguments are attached to the span. """
+    if not _enabled:
+        return _null_span
+    return _Span(name, args)
+
+
+def traced(name: str = None) -> Callable[[F], F]:
+    """ Decorator that records each call to the decorated function as a span.
+    The span name defaults to the function's qualified name. """
+    def decorator(func: F) -> F:
+        span_name = name if name is not None else func.__qualname__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            start_us = _now_us()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                _record(span_name, start_us, _now_us(), None)
+
+        return wrapper
+
+    return decorator
+
+
+def to_chrome_trace(events: list[tuple] = None) -> dict:
+    """ Builds a Chrome trace-event json object from the recorded spans. """
+    if events is None:
+        events = list(_events)
+    pid = os.getpid()
+    trace_events: list[dict] = []
+    for tid, thread_name in list(_thread_names.items()):
+        trace_events.append({"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": thread_name}})
+    for name, start_us, duration_us, tid, args in events:
+        event = {"name": name, "ph": "X", "ts": start_us, "dur": duration_us, "pid": pid, "tid": tid}
+        if args:
+            event["args"] = {k: repr(v) if not isinstance(v, (int, float, str, bool)) else v for k, v in args.items()}
+        trace_events.append(event)
+    return {"traceEvents": trace_events, "displayTimeUnit": "ms"}
+
+
+def flush(path: str = None, clear: bool = True) -> str:
+    """ Writes the recorded spans to the given file as Chrome trace-event json.
+
+    Parameters
+    ----------
+    path : str, optional
+        The file to write to. Defaults to the path given to enable().
+    clear : bool, optional
+        If True, then the flushed spans are removed from the ring buffer.
+
+    Returns
+    -------
+    path: str
+        The file that was written.
+    """
+    global _events
+    if path is None:
+        path = default_path
+
+    with _flush_lock:
+        events = list(_events)
+        if clear:
+            _events = collections.deque(maxlen=_events.maxlen)
+        trace = to_chrome_trace(events)
+        with open(path, "w") as fout:
+            json.dump(trace, fout)
+
+    return path
+
+
+def install_signal_handler(path: str = None) -> bool:
+    """ Flushes the recorded spans to the given path whenever the process
+    receives SIGBREAK (ctrl+break, on Windows) or SIGUSR1 (elsewhere).
+    Must be called from the main thread.
+
+    Returns
+    -------
+    installed: bool
+        False if neither signal is available on this platform.
+    """
+    signum = getattr(signal, "SIGBREAK", None) or getattr(signal, "SIGUSR1", None)
+    if signum is None:
+        return False
+
+    def on_signal(signum, frame):
+        print(f"Wrote trace to {flush(path)}")
+
+    signal.signal(signum, on_signal)
+    return True
+
+
+if os.environ.get("DISCORDCONTROL_TRACE"):
+    enable(os.environ["DISCORDCONTROL_TRACE"])